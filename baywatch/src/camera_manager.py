@@ -1,30 +1,71 @@
 import os
-import requests
 import time
 from picamera2 import Picamera2, MappedArray
 import threading
 import io
+import shutil
+import subprocess
+import tempfile
+import uuid
 import cv2
+import numpy as np
 from picamera2.encoders import H264Encoder
-from picamera2.outputs import FfmpegOutput
+from picamera2.outputs import FfmpegOutput, CircularOutput
 from datetime import datetime
+from upload_spool import UploadSpool, PRIORITY_IMAGE, PRIORITY_VIDEO, PRIORITY_MONITORING
 
 LOG_PREFIX = "[camera]"
 COOLDOWN = 0.25
 DETECTION_INTERVAL = 20
+CASCADE_PATH = "src/haarcascade_frontalface_default.xml"
+# Detection runs on a downscaled lores stream, a few frames a second
+ANALYSIS_WIDTH = 640
+DETECTION_FRAME_INTERVAL_S = 0.2
 
 HIGH_FRAME_RATE_CAPTURE_EVERY_N = 5
 LOW_FRAME_RATE_CAPTURE_EVERY_N = 30
 BIT_RATE_KBPS = 400
 DEFAULT_CAPTURE_DURATION_M = 6
 MONITORING_CAPTURE_DURATION_S = 30
+VIDEO_SIZE = (1600, 1296)
+PREVIEW_SIZE = (2304, 1296)
+
+# Monitoring requests arm a motion detector on the lores stream instead of recording straight away
+MOTION_DETECTION_ON = os.environ.get("BAYWATCH_MOTION_DETECTION", "true").lower() == "true"
+MOTION_TRIGGER = os.environ.get("BAYWATCH_MOTION_TRIGGER", "record")
+MOTION_THRESHOLD = float(os.environ.get("BAYWATCH_MOTION_THRESHOLD", "0.02"))
+MOTION_COOLDOWN_S = int(os.environ.get("BAYWATCH_MOTION_COOLDOWN_S", "60"))
+MOTION_PIXEL_DELTA = 20
+MOTION_DOWNSCALE = 4
+MOTION_FRAME_INTERVAL_S = 0.5
+MOTION_ARM_S = 5 * 60
+
+# Continuous mode keeps the camera streaming into an in-memory H.264 ring buffer
+CONTINUOUS_MODE = os.environ.get("BAYWATCH_CONTINUOUS_MODE", "true").lower() == "true"
+CONTINUOUS_FRAME_RATE = 15
+CONTINUOUS_CAPTURE_EVERY_N = 2
+PRE_TRIGGER_S = 20
+
+# Recordings are muxed into fixed-length segments that upload while the capture continues
+SEGMENT_DURATION_S = 30
+SEGMENT_DIR = os.environ.get("BAYWATCH_SEGMENT_DIR", "/tmp/baywatch")
+SEGMENT_LIST = "segments.txt"
+FFMPEG_EXIT_TIMEOUT_S = 60
+
+def analysis_size(size):
+    width, height = size
+    # YUV420 needs even dimensions
+    return (ANALYSIS_WIDTH, round(height * ANALYSIS_WIDTH / width / 2) * 2)
 
 class CameraManager:
     def __init__(self):
         try:
             self.camera = Picamera2()
             self.camera.stop()
-            self.camera.configure(self.camera.create_preview_configuration(main={"format": 'XRGB8888', "size": (2304, 1296)}))
+            if CONTINUOUS_MODE:
+                self.start_continuous()
+            else:
+                self.configure_preview()
         except Exception as e:
             self.runtime_error(f"Fatal error: Failed to initialize camera: {e}")
         self.cooldown = COOLDOWN
@@ -32,8 +73,50 @@ class CameraManager:
         self.last_detection_time = 0
         self.pending_recording = False
         self.lock = threading.Lock()
+        self.upload_spool = UploadSpool()
+        self.upload_spool.start()
+        self.face_detector = None
+        self.motion_token = None
+        self.motion_armed_until = 0
+        self.last_motion_trigger_time = 0
+        if CONTINUOUS_MODE and MOTION_DETECTION_ON:
+            threading.Thread(target=self.motion_loop, daemon=True).start()
+
+    def start_continuous(self):
+        # One video configuration serves stills, recordings and detection, so nothing waits on camera start-up
+        self.camera.configure(self.camera.create_video_configuration(
+            main={"format": 'XRGB8888', "size": VIDEO_SIZE},
+            lores={"format": 'YUV420', "size": analysis_size(VIDEO_SIZE)},
+            controls={"ExposureValue": 0.75, "FrameRate": CONTINUOUS_FRAME_RATE}
+        ))
+        self.encoder = H264Encoder(bitrate=BIT_RATE_KBPS * 1000)
+        self.encoder.frame_skip_count = CONTINUOUS_CAPTURE_EVERY_N
+        self.ring_buffer = CircularOutput(buffersize=int(PRE_TRIGGER_S * self.encoded_frame_rate()))
+        self.segment_muxer = None
+        self.camera.pre_callback = self.apply_timestamp
+        self.camera.start_recording(self.encoder, self.ring_buffer)
+        print(f"{LOG_PREFIX} Streaming continuously with a {PRE_TRIGGER_S} second pre-trigger buffer")
+
+    def configure_preview(self):
+        self.camera.configure(self.camera.create_preview_configuration(
+            main={"format": 'XRGB8888', "size": PREVIEW_SIZE},
+            lores={"format": 'YUV420', "size": analysis_size(PREVIEW_SIZE)}
+        ))
+
+    def encoded_frame_rate(self):
+        return CONTINUOUS_FRAME_RATE / CONTINUOUS_CAPTURE_EVERY_N
 
     def capture_image_to_memory(self):
+        if CONTINUOUS_MODE:
+            # Grabbed from the live stream; no need to wait for a recording to finish
+            try:
+                data = io.BytesIO()
+                self.camera.capture_file(data, format="jpeg")
+                return data.getvalue()
+            except Exception as e:
+                print(f"Error capturing image: {e}")
+                return None
+
         with self.lock:
             self.throttle()
             try:
@@ -57,26 +140,20 @@ class CameraManager:
             print(f"{LOG_PREFIX} Throttled for {self.cooldown - elapsed_time} seconds")
         self.last_request_time = time.time()
 
-    def upload_image(self, image_data, bearer_token, trigger="",):
-        base_url = os.environ['BYF_API_URL']
-        url = f"{base_url}/functions/v1/image"
-        
+    def upload_image(self, image_data, bearer_token, trigger="", metadata=None):
+        # Spooled so a slow or missing uplink never holds up the camera
         try:
-            files = {'file': ('image.jpeg', image_data, 'image/jpeg')}
-            data = {'trigger': trigger}
-            headers = {"Authorization": f"Bearer {bearer_token}"}
-            response = requests.post(url, files=files, data=data, headers=headers)
-            response.raise_for_status()
-            print("Image uploaded successfully.")
+            fields = dict({"trigger": trigger}, **(metadata or {}))
+            self.upload_spool.add_data(image_data, "image.jpeg", "image/jpeg", fields, bearer_token, PRIORITY_IMAGE)
             return True
-        except requests.exceptions.RequestException as e:
-            print(f"Error uploading image: {e}")
+        except OSError as e:
+            print(f"Error spooling image: {e}")
             return False
 
-    def capture_and_upload_thread(self, bearer_token, trigger=""):
+    def capture_and_upload_thread(self, bearer_token, trigger="", metadata=None):
         image_data = self.capture_image_to_memory()
         if image_data:
-            return self.upload_image(image_data, bearer_token, trigger=trigger)
+            return self.upload_image(image_data, bearer_token, trigger=trigger, metadata=metadata)
         else:
             print("Image capture failed. No data to upload.")
             return False
@@ -85,56 +162,100 @@ class CameraManager:
         threading.Thread(target=self.capture_and_upload_thread, args=(bearer_token, trigger), daemon=True).start()
         return {"success": True, "message": "Capture and upload started"}
     
-    def capture_video_to_memory(self, duration=DEFAULT_CAPTURE_DURATION_M * 60, monitoring_mode=False):
+    def capture_video_segments(self, recording_dir, on_segment, duration=DEFAULT_CAPTURE_DURATION_M * 60, monitoring_mode=False):
         if monitoring_mode:
             if self.lock.locked():
                 print("Camera is locked, skipping video capture")
-                return None
+                return False
         else:
             self.pending_recording = True
-        
+
         with self.lock:
             self.pending_recording = False
-            self.throttle()
-            filename = "temp.mp4"
+            queued = 0
             try:
-                self.camera.configure(self.camera.create_video_configuration(main={"size": (1600, 1296)}, controls={"ExposureValue": 0.75}))
-
-                encoder = H264Encoder(bitrate=BIT_RATE_KBPS * 1000)
-                encoder.frame_skip_count = LOW_FRAME_RATE_CAPTURE_EVERY_N if monitoring_mode else HIGH_FRAME_RATE_CAPTURE_EVERY_N
-                output = FfmpegOutput(filename)
-                
-                self.camera.pre_callback = self.apply_timestamp
-                self.camera.start_encoder(encoder, output)
-                self.camera.start()
+                self.start_segment_recording(recording_dir, monitoring_mode)
 
-                print(f"Recording for {duration} seconds")
                 for i in range(duration):
                     if self.pending_recording:
                         print(f"Stopping recording early")
-                        self.camera.stop_recording()
                         break
                     time.sleep(1)
-
-                print(f"Stopping recording")
-                self.camera.stop_recording()
-
-                with open(filename, "rb") as f:
-                    video_data = f.read()
-
-                return video_data
+                    # Spool finished segments for upload while the recording carries on
+                    queued = self.queue_segments(recording_dir, queued, on_segment)
 
             except Exception as e:
                 print(f"Error capturing video: {e}")
-                return None
 
             finally:
-                self.camera.stop()
-                self.camera.configure(self.camera.create_preview_configuration(
-                    main={"format": 'XRGB8888', "size": (2304, 1296)}
-                ))
-                if filename and os.path.exists(filename):
-                    os.remove(filename)
+                print(f"Stopping recording")
+                self.stop_segment_recording()
+
+            queued = self.queue_segments(recording_dir, queued, on_segment)
+            return queued > 0
+
+    def segment_args(self, recording_dir):
+        return [
+            "-f", "segment", "-segment_time", str(SEGMENT_DURATION_S), "-reset_timestamps", "1",
+            "-segment_list", os.path.join(recording_dir, SEGMENT_LIST), "-segment_list_type", "flat",
+            os.path.join(recording_dir, "segment%03d.mp4")
+        ]
+
+    def start_segment_recording(self, recording_dir, monitoring_mode):
+        if CONTINUOUS_MODE:
+            # The ring buffer holds a raw H.264 stream; ffmpeg wraps it into MP4 segments without re-encoding
+            self.segment_muxer = subprocess.Popen(
+                ["ffmpeg", "-y", "-loglevel", "error", "-framerate", str(self.encoded_frame_rate()),
+                 "-i", "-", "-c", "copy"] + self.segment_args(recording_dir),
+                stdin=subprocess.PIPE
+            )
+            # Starting the output flushes the buffered pre-trigger frames first
+            self.ring_buffer.fileoutput = self.segment_muxer.stdin
+            self.ring_buffer.start()
+            print(f"Recording plus {PRE_TRIGGER_S} seconds of pre-trigger footage")
+            return
+
+        self.throttle()
+        self.camera.configure(self.camera.create_video_configuration(main={"size": VIDEO_SIZE}, controls={"ExposureValue": 0.75}))
+
+        encoder = H264Encoder(bitrate=BIT_RATE_KBPS * 1000)
+        encoder.frame_skip_count = LOW_FRAME_RATE_CAPTURE_EVERY_N if monitoring_mode else HIGH_FRAME_RATE_CAPTURE_EVERY_N
+        # FfmpegOutput hands its output string to ffmpeg as arguments, so it can carry the segment muxer options
+        output = FfmpegOutput(" ".join(self.segment_args(recording_dir)))
+
+        self.camera.pre_callback = self.apply_timestamp
+        self.camera.start_encoder(encoder, output)
+        self.camera.start()
+        print(f"Recording")
+
+    def stop_segment_recording(self):
+        if CONTINUOUS_MODE:
+            if self.segment_muxer is None:
+                return
+            try:
+                self.ring_buffer.stop()
+                self.segment_muxer.stdin.close()
+                self.segment_muxer.wait(timeout=FFMPEG_EXIT_TIMEOUT_S)
+            except subprocess.TimeoutExpired:
+                print(f"Segment muxer did not exit, killing it")
+                self.segment_muxer.kill()
+            finally:
+                self.segment_muxer = None
+            return
+
+        self.camera.stop_recording()
+        self.configure_preview()
+
+    def queue_segments(self, recording_dir, queued, on_segment):
+        # ffmpeg only lists a segment once it has been closed
+        list_path = os.path.join(recording_dir, SEGMENT_LIST)
+        if not os.path.exists(list_path):
+            return queued
+        with open(list_path) as f:
+            names = [line.strip() for line in f if line.strip()]
+        for segment in range(queued, len(names)):
+            on_segment(os.path.join(recording_dir, os.path.basename(names[segment])), segment)
+        return len(names)
 
     def apply_timestamp(self, request):
         colour = (255, 255, 255)
@@ -158,31 +279,40 @@ class CameraManager:
 
             cv2.putText(m.array, timestamp, origin, font, scale, colour, thickness)
 
-    def upload_video(self, video_data, bearer_token, trigger=""):
-        base_url = os.environ['BYF_API_URL']
-        url = f"{base_url}/functions/v1/image"
+    def spool_video_segment(self, video_path, segment, bearer_token, trigger, recording_id, monitoring_mode, metadata=None):
         try:
-            files = {"file": ("video.mp4", video_data, "video/mp4")}
-            data = {"trigger": trigger}
-            headers = {"Authorization": f"Bearer {bearer_token}"}
-            response = requests.post(url, files=files, data=data, headers=headers)
-            response.raise_for_status()
-            print("Video uploaded successfully.")
-            return True
-        except requests.exceptions.RequestException as e:
-            print(f"Error uploading video: {e}")
-            return False
+            fields = dict({"trigger": trigger, "recording_id": recording_id, "segment": segment}, **(metadata or {}))
+            self.upload_spool.add_file(
+                video_path, f"video_{segment:03d}.mp4", "video/mp4", fields,
+                bearer_token, PRIORITY_MONITORING if monitoring_mode else PRIORITY_VIDEO
+            )
+        except OSError as e:
+            print(f"Error spooling video segment {segment}: {e}")
+
+    def record_and_upload_thread(self, bearer_token, trigger="", duration=DEFAULT_CAPTURE_DURATION_M * 60, monitoring_mode=False, metadata=None):
+        os.makedirs(SEGMENT_DIR, exist_ok=True)
+        recording_dir = tempfile.mkdtemp(dir=SEGMENT_DIR)
+        recording_id = uuid.uuid4().hex
+
+        def on_segment(video_path, segment):
+            self.spool_video_segment(video_path, segment, bearer_token, trigger, recording_id, monitoring_mode, metadata)
 
-    def record_and_upload_thread(self, bearer_token, trigger="", duration=DEFAULT_CAPTURE_DURATION_M * 60, monitoring_mode=False):
-        video_data = self.capture_video_to_memory(duration, monitoring_mode)
-        if video_data:
-            return self.upload_video(video_data, bearer_token, trigger=trigger)
-        else:
+        try:
+            captured = self.capture_video_segments(recording_dir, on_segment, duration, monitoring_mode)
+        finally:
+            shutil.rmtree(recording_dir, ignore_errors=True)
+
+        if not captured:
             print("Video capture failed. No data to upload.")
-            return False
+        return captured
 
     def record_and_upload(self, bearer_token, trigger=""):
-        if trigger == "monitoring":
+        if trigger == "monitoring" and CONTINUOUS_MODE and MOTION_DETECTION_ON:
+            # Each monitoring request also refreshes the token motion-triggered uploads use
+            self.motion_token = bearer_token
+            self.motion_armed_until = time.time() + MOTION_ARM_S
+            return {"success": True, "message": "Motion monitoring armed"}
+        elif trigger == "monitoring":
             threading.Thread(
                 target=self.record_and_upload_thread, 
                 args=(bearer_token, trigger, MONITORING_CAPTURE_DURATION_S, True),
@@ -196,40 +326,110 @@ class CameraManager:
             ).start()
         return {"success": True, "message": "Record and upload started"}
         
+    def downscaled_luma(self):
+        grey = self.capture_analysis_frame()
+        k = MOTION_DOWNSCALE
+        height, width = grey.shape[0] // k * k, grey.shape[1] // k * k
+        # Block averaging also smooths out sensor noise
+        return grey[:height, :width].reshape(height // k, k, width // k, k).mean(axis=(1, 3), dtype=np.float32)
+
+    def motion_score(self, frame, previous):
+        diff = frame - previous
+        # Ignore brightness shifts across the whole frame, e.g. auto exposure settling
+        diff -= diff.mean()
+        return float(np.count_nonzero(np.abs(diff) > MOTION_PIXEL_DELTA)) / diff.size
+
+    def motion_loop(self):
+        previous = None
+        while True:
+            time.sleep(MOTION_FRAME_INTERVAL_S)
+            if time.time() > self.motion_armed_until:
+                previous = None
+                continue
+
+            try:
+                frame = self.downscaled_luma()
+            except Exception as e:
+                print(f"{LOG_PREFIX} Motion frame capture failed: {e}")
+                previous = None
+                continue
+
+            if previous is None:
+                previous = frame
+                continue
+            score = self.motion_score(frame, previous)
+            previous = frame
+
+            if score < MOTION_THRESHOLD:
+                continue
+            if time.time() - self.last_motion_trigger_time < MOTION_COOLDOWN_S or self.lock.locked():
+                continue
+            self.last_motion_trigger_time = time.time()
+            self.trigger_motion_capture(score)
+
+    def trigger_motion_capture(self, score):
+        print(f"{LOG_PREFIX} Motion detected (score {score:.3f}), starting {MOTION_TRIGGER}")
+        metadata = {"motion_score": f"{score:.4f}"}
+        if MOTION_TRIGGER == "capture":
+            threading.Thread(
+                target=self.capture_and_upload_thread,
+                args=(self.motion_token, "monitoring", metadata),
+                daemon=True
+            ).start()
+        else:
+            threading.Thread(
+                target=self.record_and_upload_thread,
+                args=(self.motion_token, "monitoring", MONITORING_CAPTURE_DURATION_S, True, metadata),
+                daemon=True
+            ).start()
+
     def runtime_error(self, message):
         print(f"Runtime error: {message}")
         time.sleep(10)
         raise Exception(message)
     
-    def detection_thread(self, bearer_token, face_detector, trigger=""):
-        with self.lock:
-            self.throttle()
-            self.camera.start()
-
-            start_time = time.time()
-            print("Starting detection")
-            face_detected = False
-            while time.time() - start_time < DETECTION_INTERVAL and not face_detected: 
-                im = self.camera.capture_array()
-
-                grey = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
-                try:
-                    faces = face_detector.detectMultiScale(grey, 1.1, 5)
-                    if len(faces) > 0:
-                        print(f"Found {len(faces)} objects")
-                        face_detected = True
-                    else:
-                        print("No objects detected")
-                except cv2.error as e:
-                    print(f"OpenCV error during face detection: {e}")
-                    break
-
-                for (x, y, w, h) in faces:
-                    cv2.rectangle(im, (x, y), (x + w, y + h), (0, 255, 0))
-
-                time.sleep(0.001)
+    def capture_analysis_frame(self):
+        # The Y plane of the lores YUV420 stream is already greyscale
+        width, height = self.camera.camera_config["lores"]["size"]
+        return self.camera.capture_array("lores")[:height, :width]
+
+    def detect_faces(self, face_detector):
+        start_time = time.time()
+        print("Starting detection")
+        faces = ()
+        while time.time() - start_time < DETECTION_INTERVAL:
+            grey = self.capture_analysis_frame()
+            try:
+                faces = face_detector.detectMultiScale(grey, 1.1, 5)
+            except cv2.error as e:
+                print(f"OpenCV error during face detection: {e}")
+                return False, None
+
+            if len(faces) > 0:
+                print(f"Found {len(faces)} objects")
+                break
+            print("No objects detected")
+            time.sleep(DETECTION_FRAME_INTERVAL_S)
+
+        if len(faces) == 0:
+            return False, None
+
+        # Only the frame being uploaded is taken at full resolution
+        im = self.camera.capture_array()
+        scale = im.shape[1] / grey.shape[1]
+        for (x, y, w, h) in faces:
+            cv2.rectangle(im, (int(x * scale), int(y * scale)), (int((x + w) * scale), int((y + h) * scale)), (0, 255, 0))
+        return True, im
 
-            self.camera.stop()
+    def detection_thread(self, bearer_token, face_detector, trigger=""):
+        if CONTINUOUS_MODE:
+            face_detected, im = self.detect_faces(face_detector)
+        else:
+            with self.lock:
+                self.throttle()
+                self.camera.start()
+                face_detected, im = self.detect_faces(face_detector)
+                self.camera.stop()
 
         if face_detected:
             print("Object detected! Exiting test.")
@@ -243,21 +443,24 @@ class CameraManager:
             print("Detection already in progress")
             return {"success": False, "message": "Detection already in progress"}
 
-        cascade_path = "src/haarcascade_frontalface_default.xml"
+        # Loaded on first use and kept for the life of the service
+        if self.face_detector is None:
+            if not os.path.isfile(CASCADE_PATH):
+                print(f"Error: Cascade file not found at {CASCADE_PATH}")
+                return {"success": False, "message": "Cascade file not found"}
 
-        if not os.path.isfile(cascade_path):
-            print(f"Error: Cascade file not found at {cascade_path}")
-            return {"success": False, "message": "Cascade file not found"}
+            face_detector = cv2.CascadeClassifier(CASCADE_PATH)
+
+            if face_detector.empty():
+                print("Error: Failed to load cascade classifier")
+                return {"success": False, "message": "Failed to load cascade classifier"}
+            self.face_detector = face_detector
 
-        face_detector = cv2.CascadeClassifier(cascade_path)
-        
-        if face_detector.empty():
-            print("Error: Failed to load cascade classifier")
-            return {"success": False, "message": "Failed to load cascade classifier"}
-        
         self.last_detection_time = time.time()
-        threading.Thread(target=self.detection_thread, args=(bearer_token, face_detector, trigger), daemon=True).start()
+        threading.Thread(target=self.detection_thread, args=(bearer_token, self.face_detector, trigger), daemon=True).start()
         return {"success": True, "message": "Detection started"}
 
     def close(self):
+        if CONTINUOUS_MODE:
+            self.camera.stop_recording()
         self.camera.close()
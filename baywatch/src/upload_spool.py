@@ -0,0 +1,259 @@
+import os
+import json
+import shutil
+import threading
+import time
+import uuid
+import requests
+
+LOG_PREFIX = "[spool]"
+
+SPOOL_DIR = os.environ.get("BAYWATCH_SPOOL_DIR", "/data/upload_spool")
+# Only the latest bearer token is kept on disk, readable by the owner alone
+TOKEN_FILE = "bearer_token"
+SPOOL_MAX_BYTES = int(os.environ.get("BAYWATCH_SPOOL_MAX_MB", "200")) * 1024 * 1024
+# 0 disables the cap
+UPLOAD_RATE_KBPS = int(os.environ.get("BAYWATCH_UPLOAD_KBPS", "1000"))
+UPLOAD_TIMEOUT_S = (5, 60)
+
+RETRY_BASE_S = 5
+RETRY_MAX_S = 10 * 60
+MAX_ATTEMPTS = 10
+# The token may have been refreshed by the time of the retry; anything else 4xx won't succeed later
+RETRY_STATUSES = (401, 408, 429)
+
+# Lower uploads first
+PRIORITY_IMAGE = 0
+PRIORITY_VIDEO = 1
+PRIORITY_MONITORING = 2
+
+class ThrottledUploadBody:
+    # Multipart body read straight from the spool file, paced to the bandwidth cap
+    def __init__(self, path, filename, content_type, fields, rate_kbps):
+        self.boundary = uuid.uuid4().hex
+        head = b""
+        for name, value in fields.items():
+            head += f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        self.head = head
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self.file = open(path, "rb")
+        self.length = len(self.head) + os.path.getsize(path) + len(self.tail)
+        self.rate = rate_kbps * 1000 / 8
+        self.sent = 0
+        self.started = None
+
+    def __len__(self):
+        return self.length
+
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+        chunk = b""
+        if self.head:
+            chunk, self.head = self.head[:size], self.head[size:]
+        if len(chunk) < size:
+            chunk += self.file.read(size - len(chunk))
+        if len(chunk) < size and self.tail:
+            remaining = size - len(chunk)
+            chunk, self.tail = chunk + self.tail[:remaining], self.tail[remaining:]
+        self.throttle(len(chunk))
+        return chunk
+
+    def throttle(self, size):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.sent += size
+        if not self.rate:
+            return
+        ahead = self.sent / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def close(self):
+        self.file.close()
+
+class UploadSpool:
+    def __init__(self, spool_dir=SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES, rate_kbps=UPLOAD_RATE_KBPS):
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.rate_kbps = rate_kbps
+        self.condition = threading.Condition()
+        self.items = {}
+        self.uploading = None
+        self.bearer_token = self.load_token()
+        self.load()
+
+    def data_path(self, item_id):
+        return os.path.join(self.spool_dir, f"{item_id}.bin")
+
+    def meta_path(self, item_id):
+        return os.path.join(self.spool_dir, f"{item_id}.json")
+
+    def token_path(self):
+        return os.path.join(self.spool_dir, TOKEN_FILE)
+
+    def load_token(self):
+        try:
+            with open(self.token_path()) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"{LOG_PREFIX} Failed to load bearer token: {e}")
+            return None
+
+    def save_token(self, bearer_token):
+        temp_path = self.token_path() + ".tmp"
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(bearer_token)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.token_path())
+        except OSError as e:
+            print(f"{LOG_PREFIX} Failed to save bearer token: {e}")
+
+    def load(self):
+        for name in os.listdir(self.spool_dir):
+            item_id, ext = os.path.splitext(name)
+            path = os.path.join(self.spool_dir, name)
+            if ext == ".json":
+                try:
+                    with open(path) as f:
+                        item = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"{LOG_PREFIX} Dropping unreadable spool entry {name}: {e}")
+                    os.remove(path)
+                    continue
+                if os.path.exists(self.data_path(item_id)):
+                    self.items[item_id] = item
+                else:
+                    os.remove(path)
+        # Media written without its metadata was never queued
+        for name in os.listdir(self.spool_dir):
+            item_id, ext = os.path.splitext(name)
+            if ext != ".json" and item_id not in self.items and name != TOKEN_FILE:
+                os.remove(os.path.join(self.spool_dir, name))
+        if self.items:
+            print(f"{LOG_PREFIX} Restored {len(self.items)} pending uploads")
+
+    def add_data(self, data, filename, content_type, fields, bearer_token, priority):
+        item_id = uuid.uuid4().hex
+        with open(self.data_path(item_id), "wb") as f:
+            f.write(data)
+        return self.add(item_id, filename, content_type, fields, bearer_token, priority)
+
+    def add_file(self, path, filename, content_type, fields, bearer_token, priority):
+        item_id = uuid.uuid4().hex
+        shutil.move(path, self.data_path(item_id))
+        return self.add(item_id, filename, content_type, fields, bearer_token, priority)
+
+    def add(self, item_id, filename, content_type, fields, bearer_token, priority):
+        item = {
+            "id": item_id,
+            "filename": filename,
+            "content_type": content_type,
+            "fields": fields,
+            "priority": priority,
+            "size": os.path.getsize(self.data_path(item_id)),
+            "created_at": time.time(),
+            "attempts": 0,
+            "next_attempt_at": 0
+        }
+        self.save(item)
+        with self.condition:
+            self.items[item_id] = item
+            if bearer_token != self.bearer_token:
+                self.bearer_token = bearer_token
+                self.save_token(bearer_token)
+            self.evict()
+            self.condition.notify()
+        print(f"{LOG_PREFIX} Queued {filename} ({len(self.items)} pending)")
+        return item_id
+
+    def save(self, item):
+        temp_path = self.meta_path(item["id"]) + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(item, f)
+        os.replace(temp_path, self.meta_path(item["id"]))
+
+    def remove(self, item_id):
+        self.items.pop(item_id, None)
+        for path in (self.meta_path(item_id), self.data_path(item_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def evict(self):
+        total = sum(item["size"] for item in self.items.values())
+        for item in sorted(self.items.values(), key=lambda item: item["created_at"]):
+            if total <= self.max_bytes or len(self.items) <= 1:
+                break
+            if item["id"] == self.uploading:
+                continue
+            print(f"{LOG_PREFIX} Spool full, dropping {item['filename']} from {time.ctime(item['created_at'])}")
+            self.remove(item["id"])
+            total -= item["size"]
+
+    def next_item(self):
+        with self.condition:
+            while True:
+                now = time.time()
+                ready = [item for item in self.items.values() if item["next_attempt_at"] <= now]
+                if ready:
+                    item = min(ready, key=lambda item: (item["priority"], item["created_at"]))
+                    self.uploading = item["id"]
+                    return item
+                wait_s = min((item["next_attempt_at"] - now for item in self.items.values()), default=None)
+                self.condition.wait(timeout=wait_s)
+
+    def upload(self, item):
+        url = f"{os.environ['BYF_API_URL']}/functions/v1/image"
+        body = ThrottledUploadBody(self.data_path(item["id"]), item["filename"], item["content_type"], item["fields"], self.rate_kbps)
+        try:
+            headers = {"Authorization": f"Bearer {self.bearer_token}", "Content-Type": body.content_type()}
+            response = requests.post(url, data=body, headers=headers, timeout=UPLOAD_TIMEOUT_S)
+            if response.ok:
+                print(f"{LOG_PREFIX} Uploaded {item['filename']}")
+                return True, False
+            print(f"{LOG_PREFIX} Upload of {item['filename']} failed with {response.status_code}")
+            return False, response.status_code in RETRY_STATUSES or response.status_code >= 500
+        except requests.exceptions.RequestException as e:
+            print(f"{LOG_PREFIX} Error uploading {item['filename']}: {e}")
+            return False, True
+        finally:
+            body.close()
+
+    def process_uploads(self):
+        while True:
+            item = self.next_item()
+            try:
+                success, retry = self.upload(item)
+            except OSError as e:
+                print(f"{LOG_PREFIX} Could not read {item['filename']}: {e}")
+                success, retry = False, False
+            with self.condition:
+                self.uploading = None
+                if item["id"] not in self.items:
+                    continue
+                item["attempts"] += 1
+                if success or not retry or item["attempts"] >= MAX_ATTEMPTS:
+                    if not success:
+                        print(f"{LOG_PREFIX} Giving up on {item['filename']} after {item['attempts']} attempts")
+                    self.remove(item["id"])
+                    continue
+                delay = min(RETRY_BASE_S * 2 ** (item["attempts"] - 1), RETRY_MAX_S)
+                item["next_attempt_at"] = time.time() + delay
+                self.save(item)
+            print(f"{LOG_PREFIX} Retrying {item['filename']} in {delay} seconds")
+
+    def start(self):
+        # One uploader so the store's uplink only ever carries one paced upload
+        threading.Thread(target=self.process_uploads, daemon=True).start()
@@ -1,11 +1,20 @@
 from flask import Flask, jsonify, request
 import threading
 from byf_api_client import BYFAPIClient
+from print_job_queue import PrintJobJournal, PrintJobQueue, summarize_group
+from service_client import get_service_client
+from printer_pool import get_printer_pool
+from camera_dispatcher import CameraDispatcher
 from utils import restart_service, start_service, stop_service, get_service_status
 import requests
 import pygame
 import time
-from cachetools import TTLCache, cached
+import os
+import json
+import uuid
+import functools
+from cachetools import TTLCache
+from cachetools.keys import hashkey
 
 app = Flask(__name__)
 
@@ -22,20 +31,68 @@ SERVICE_STOP_START_MIN_TIME_S = 8
 SERVICE_STOP_START_TIMEOUT_S = 15
 SERVICE_STOP_START_CHECK_INTERVAL_S = 1
 
+# Number of printers attached to each printer service; one print worker each
+RECEIPT_PRINTER_COUNT = int(os.environ.get('RECEIPT_PRINTER_COUNT', 1))
+LABEL_PRINTER_COUNT = int(os.environ.get('LABEL_PRINTER_COUNT', 1))
+
 SUCCESS_SOUND = pygame.mixer.Sound('success2.wav')
 SUCCESS_SOUND.set_volume(1.0)
 
 print_receipt_cache = TTLCache(maxsize=100, ttl=45)
 print_label_cache = TTLCache(maxsize=100, ttl=5)
-
-print_receipt_lock = threading.Lock()
-print_label_lock = threading.Lock()
+print_receipt_cache_lock = threading.Lock()
+print_label_cache_lock = threading.Lock()
+
+def cached_once(cache, lock, key=hashkey):
+    # cachetools' cached() only locks the lookup and the store, so with several print workers two copies
+    # of a request could both miss the cache and print on two printers; copies wait for the first instead
+    in_flight = {}
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            with lock:
+                if k in cache:
+                    return cache[k]
+                done = in_flight.get(k)
+                first = done is None
+                if first:
+                    done = in_flight[k] = threading.Event()
+            if not first:
+                done.wait()
+                with lock:
+                    return cache.get(k, False)
+            try:
+                result = func(*args, **kwargs)
+                with lock:
+                    cache[k] = result
+                return result
+            finally:
+                with lock:
+                    in_flight.pop(k, None)
+                done.set()
+        return wrapper
+    return decorator
+
+print_job_journal = PrintJobJournal()
+camera_dispatcher = CameraDispatcher(print_job_journal)
+
+receipt_printer_client = get_service_client("receipt-printer")
+label_printer_client = get_service_client("label-printer")
+baywatch_client = get_service_client("baywatch")
+porchlight_client = get_service_client("porchlight")
+wave_client = get_service_client("wave")
+receipt_printer_pool = get_printer_pool("receipt-printer")
+label_printer_pool = get_printer_pool("label-printer")
+
+def _with_printer(params, printer_id):
+    return dict(params, printer=printer_id) if printer_id else params
 
 def capture_image(trigger):
     try:
         print(f"Sending capture request to baywatch with trigger: {trigger}")
         token = byf_client.get_access_token()
-        response = requests.get(f'http://baywatch:1234/capture?token={token}&trigger={trigger}')
+        response = baywatch_client.get('/capture', params={'token': token, 'trigger': trigger})
         response.raise_for_status()
         return {"success": True, "message": "Image capture request sent"}
     except requests.RequestException as e:
@@ -46,7 +103,7 @@ def capture_recording(trigger):
     try:
         print(f"Sending record request to baywatch with trigger: {trigger}")
         token = byf_client.get_access_token()
-        response = requests.get(f'http://baywatch:1234/record?token={token}&trigger={trigger}')
+        response = baywatch_client.get('/record', params={'token': token, 'trigger': trigger})
         response.raise_for_status()
         return {"success": True, "message": "Recording request sent"}
     except requests.RequestException as e:
@@ -56,9 +113,28 @@ def capture_recording(trigger):
 def detect_image(trigger):
     print(f"Sending detect request to baywatch with trigger: {trigger}")
     token = byf_client.get_access_token()
-    response = requests.get(f'http://baywatch:1234/detect?token={token}&trigger={trigger}')
+    response = baywatch_client.get('/detect', params={'token': token, 'trigger': trigger})
     return response
 
+def detect_image_result(trigger):
+    try:
+        response = detect_image(trigger)
+        return {"success": response.ok, "message": response.json().get('message', '')}
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error detecting image: {str(e)}")
+        return {"success": False, "message": "Error detecting image"}
+
+def dispatch_camera_trigger(args, job_id=None):
+    if args.get('image') == 'true':
+        handler = capture_image
+    elif args.get('detect') == 'true':
+        handler = detect_image_result
+    elif args.get('record') == 'true':
+        handler = capture_recording
+    else:
+        return True
+    return camera_dispatcher.dispatch(handler, args.get('trigger'), job_id)
+
 def _play_success_sound():
     SUCCESS_SOUND.play()
     print("Playing success sound...")
@@ -71,7 +147,7 @@ def play_success_sound():
 @app.route('/receipt/status')
 def get_receipt_printer_status():
     try:
-        response = requests.get('http://receipt-printer:1234/status')
+        response = receipt_printer_client.get('/status')
         response.raise_for_status()
         return jsonify(response.json())
     except requests.RequestException as e:
@@ -82,11 +158,14 @@ def get_receipt_printer_status():
 def configure_receipt_printer():
     fast = request.args.get('fast', 'false')
     high_density = request.args.get('high_density', 'true')
-    success = requests.get(f'http://receipt-printer:1234/configure?fast={fast}&high_density={high_density}').json().get('success', False)
-    restart_service("receipt-printer")
+    try:
+        success = receipt_printer_client.get('/configure', params={'fast': fast, 'high_density': high_density}).json().get('success', False)
+    except requests.RequestException as e:
+        print(f"Error sending receipt printer configure request: {str(e)}")
+        return jsonify({"success": False})
     return jsonify({"success": success})
 
-@cached(cache=print_receipt_cache)
+@cached_once(print_receipt_cache, print_receipt_cache_lock)
 def print_receipt_cached(order, upcs, details, message, wait):
     try:
         _play_success_sound()
@@ -97,10 +176,13 @@ def print_receipt_cached(order, upcs, details, message, wait):
             "message": message,
             "wait": wait
         }
-        response = requests.get("http://receipt-printer:1234/print", params=params)
-        response.raise_for_status()
-        success = response.json().get('success', False)
-        print(f"Receipt print success: {success}")
+        def send(printer_id):
+            response = receipt_printer_client.get('/print', params=_with_printer(params, printer_id))
+            response.raise_for_status()
+            return response.json()
+        result = receipt_printer_pool.submit(send)
+        success = result.get('success', False)
+        print(f"Receipt print success: {success} (printer {result.get('printer')})")
         if success:
             byf_client.notify_print_success(order)
         return success
@@ -108,45 +190,32 @@ def print_receipt_cached(order, upcs, details, message, wait):
         print(f"Error printing receipt: {str(e)}")
         return False
 
-def print_receipt_async(order, upcs, details, message, wait):
-    with print_receipt_lock:
-        return print_receipt_cached(order, upcs, details, message, wait)
-
+receipt_job_queue = PrintJobQueue("receipt-printer", {"receipt": print_receipt_cached}, print_job_journal, workers=RECEIPT_PRINTER_COUNT)
 
 @app.route('/receipt/print')
 def print_receipt():
-    image_error = False
     image_capture = 'trigger' in request.args
-    if image_capture:
-        try:
-            if request.args.get('image') == 'true':
-                capture_image(request.args.get('trigger'))
-            elif request.args.get('detect') == 'true':
-                detect_image(request.args.get('trigger')) 
-            elif request.args.get('record') == 'true':
-                capture_recording(request.args.get('trigger'))
-        except Exception as e:
-            image_error = True
-            print(f"Error capturing image: {str(e)}")
-        
-    
+
     order = request.args.get('order', '')
     message = request.args.get('message', '')
-    upcs = request.args.get('upcs', [])
+    upcs = request.args.get('upcs', '')
     details = request.args.get('details', '')
     wait = request.args.get('wait', None)
     
-    threading.Thread(target=print_receipt_async, args=(order, upcs, details, message, wait), daemon=True).start()
+    job_id = receipt_job_queue.submit({"order": order, "upcs": upcs, "details": details, "message": message, "wait": wait})
+    if not job_id:
+        return jsonify({"success": False, "message": "Receipt print queue full"}), 503
+    image_error = image_capture and not dispatch_camera_trigger(request.args, job_id)
     
     if image_capture:
-        return jsonify({"success": True, "message": "Receipt print job started", "image_error": image_error})
+        return jsonify({"success": True, "message": "Receipt print job started", "job_id": job_id, "image_error": image_error})
     else:
-        return jsonify({"success": True, "message": "Receipt print job started"})
+        return jsonify({"success": True, "message": "Receipt print job started", "job_id": job_id})
 
 @app.route('/receipt/reload')
 def reload_receipt_paper():
     try:
-        success = requests.get('http://receipt-printer:1234/reload').json().get('success', False)
+        success = receipt_printer_client.get('/reload').json().get('success', False)
         return jsonify({"success": success})
     except requests.RequestException as e:
         print(f"Error sending receipt printer reload request: {str(e)}")
@@ -155,7 +224,7 @@ def reload_receipt_paper():
 @app.route('/label/status')
 def get_label_printer_status():
     try:
-        response = requests.get('http://label-printer:1234/status')
+        response = label_printer_client.get('/status')
         response.raise_for_status()
         return jsonify(response.json())
     except requests.RequestException as e:
@@ -166,14 +235,17 @@ def get_label_printer_status():
 def configure_label_printer():
     buzzer = request.args.get('buzzer', 'false')
     paper_removal_standby = request.args.get('paper_removal_standby', 'false')
-    success = requests.get(f'http://label-printer:1234/configure?buzzer={buzzer}&paper_removal_standby={paper_removal_standby}').json().get('success', False)
-    restart_service("label-printer")
+    try:
+        success = label_printer_client.get('/configure', params={'buzzer': buzzer, 'paper_removal_standby': paper_removal_standby}).json().get('success', False)
+    except requests.RequestException as e:
+        print(f"Error sending label printer configure request: {str(e)}")
+        return jsonify({"success": False})
     return jsonify({"success": success})
 
 def _get_label_cache_key(order, item, upcs, item_number, item_total, fulfillment, paid):
     return f"{order}-{item}-{item_number}-{item_total}-{fulfillment}-{paid}"
 
-@cached(cache=print_label_cache, key=_get_label_cache_key)
+@cached_once(print_label_cache, print_label_cache_lock, key=_get_label_cache_key)
 def print_label_cached(order, item, upcs, item_number, item_total, fulfillment, paid):
     try:
         params = {
@@ -185,10 +257,13 @@ def print_label_cached(order, item, upcs, item_number, item_total, fulfillment,
             "fulfillment": fulfillment,
             "paid": paid
         }
-        response = requests.get("http://label-printer:1234/print", params=params)
-        response.raise_for_status()
-        success = response.json().get('success', False)
-        print(f"Label print success: {success}")
+        def send(printer_id):
+            response = label_printer_client.get('/print', params=_with_printer(params, printer_id))
+            response.raise_for_status()
+            return response.json()
+        result = label_printer_pool.submit(send)
+        success = result.get('success', False)
+        print(f"Label print success: {success} (printer {result.get('printer')})")
         if fulfillment and success:
             byf_client.notify_label_success(fulfillment)
         return success
@@ -196,25 +271,35 @@ def print_label_cached(order, item, upcs, item_number, item_total, fulfillment,
         print(f"Error printing label: {str(e)}")
         return False
 
-def print_label_async(order, item, upcs, item_number, item_total, fulfillment, paid):
-    with print_label_lock:
-        return print_label_cached(order, item, upcs, item_number, item_total, fulfillment, paid)
+def _get_label_batch_cache_key(order, items):
+    return f"{order}-{json.dumps(items, sort_keys=True)}"
+
+@cached_once(print_label_cache, print_label_cache_lock, key=_get_label_batch_cache_key)
+def print_label_batch_cached(order, items):
+    try:
+        def send(printer_id):
+            response = label_printer_client.post('/print_batch', json=_with_printer({"order": order, "items": items}, printer_id))
+            response.raise_for_status()
+            return response.json()
+        result = label_printer_pool.submit(send)
+        results = result.get('results', [])
+        print(f"Label batch print results: {results} (printer {result.get('printer')})")
+        for label, success in zip(items, results):
+            if label.get('fulfillment') and success:
+                try:
+                    byf_client.notify_label_success(label['fulfillment'])
+                except Exception as e:
+                    print(f"Error notifying label success for {label['fulfillment']}: {str(e)}")
+        return len(results) == len(items) and all(results)
+    except Exception as e:
+        print(f"Error printing label batch: {str(e)}")
+        return False
+
+label_job_queue = PrintJobQueue("label-printer", {"label": print_label_cached, "label_batch": print_label_batch_cached}, print_job_journal, workers=LABEL_PRINTER_COUNT)
 
 @app.route('/label/print')
 def print_label():
-    image_error = False
     image_capture = 'trigger' in request.args
-    if image_capture:
-        try:
-            if request.args.get('image') == 'true':
-                capture_image(request.args.get('trigger'))
-            elif request.args.get('detect') == 'true':
-                detect_image(request.args.get('trigger'))
-            elif request.args.get('record') == 'true':
-                capture_recording(request.args.get('trigger'))
-        except Exception as e:
-            image_error = True
-            print(f"Error capturing image: {str(e)}")
 
     order = request.args.get('order', '')
     item = request.args.get('item', '')
@@ -224,18 +309,58 @@ def print_label():
     fulfillment = request.args.get('fulfillment', '')
     paid = request.args.get('paid', 'false')
 
-    threading.Thread(target=print_label_async, args=(order, item, upcs, item_number, item_total, fulfillment, paid), daemon=True).start()
+    job_id = label_job_queue.submit({"order": order, "item": item, "upcs": upcs, "item_number": item_number, "item_total": item_total, "fulfillment": fulfillment, "paid": paid})
+    if not job_id:
+        return jsonify({"success": False, "message": "Label print queue full"}), 503
+    image_error = image_capture and not dispatch_camera_trigger(request.args, job_id)
     
     if image_capture:
-        return jsonify({"success": True, "message": "Label print job started", "image_error": image_error})
+        return jsonify({"success": True, "message": "Label print job started", "job_id": job_id, "image_error": image_error})
     else:
-        return jsonify({"success": True, "message": "Label print job started"})
+        return jsonify({"success": True, "message": "Label print job started", "job_id": job_id})
+
+def _parse_label_items(labels):
+    # None if the items aren't a list of objects
+    if not isinstance(labels, list) or not all(isinstance(label, dict) for label in labels):
+        return None
+    return [{
+        "item": label.get('item', ''),
+        "upcs": label.get('upcs', []),
+        "item_number": label.get('item_number', ''),
+        "item_total": label.get('item_total', ''),
+        "fulfillment": label.get('fulfillment', ''),
+        "paid": label.get('paid', 'false')
+    } for label in labels]
+
+@app.route('/label/print_batch', methods=['POST'])
+def print_label_batch():
+    image_capture = 'trigger' in request.args
+
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "message": "Invalid request body"}), 400
+    order = data.get('order', '')
+    items = _parse_label_items(data.get('items', []))
+    if items is None:
+        return jsonify({"success": False, "message": "Items must be a list of objects"}), 400
+    if not items:
+        return jsonify({"success": False, "message": "Items are required"}), 400
+
+    job_id = label_job_queue.submit({"order": order, "items": items}, kind="label_batch")
+    if not job_id:
+        return jsonify({"success": False, "message": "Label print queue full"}), 503
+    image_error = image_capture and not dispatch_camera_trigger(request.args, job_id)
+
+    if image_capture:
+        return jsonify({"success": True, "message": "Label batch print job started", "job_id": job_id, "image_error": image_error})
+    else:
+        return jsonify({"success": True, "message": "Label batch print job started", "job_id": job_id})
 
 @app.route('/label/print_text')
 def print_text():
     text = request.args.get('text')
     try:
-        success = requests.get(f'http://label-printer:1234/print_text?text={text}').json().get('success', False)
+        success = label_printer_client.get('/print_text', params={'text': text}).json().get('success', False)
         return jsonify({"success": success})
     except requests.RequestException as e:
         print(f"Error sending label printer text print request: {str(e)}")
@@ -254,21 +379,113 @@ def print_inventory_label():
     except ValueError:
         return jsonify({"success": False, "message": "Invalid quantity"})
     try:
-        success = requests.get(f'http://label-printer:1234/inventory?item={item}&print_date={print_date}&print_time={print_time}&quantity={quantity}').json().get('success', False)
+        success = label_printer_client.get('/inventory', params={'item': item, 'print_date': print_date, 'print_time': print_time, 'quantity': quantity}).json().get('success', False)
         return jsonify({"success": success})
     except requests.RequestException as e:
         print(f"Error sending label printer inventory request: {str(e)}")
         return jsonify({"success": False})
     
+@app.route('/label/inventory_batch', methods=['POST'])
+def print_inventory_batch():
+    data = request.json or {}
+    items = []
+    for entry in data.get('items', []):
+        try:
+            quantity = int(entry.get('quantity', 2))
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({"success": False, "message": "Invalid quantity"})
+        if quantity < 1 or quantity > 4:
+            return jsonify({"success": False, "message": "Invalid quantity"})
+        items.append({"item": entry.get('item', ''), "quantity": quantity})
+    if not items:
+        return jsonify({"success": False, "message": "Items are required"}), 400
+    try:
+        success = label_printer_client.post('/inventory_batch', json={
+            'items': items,
+            # Passed through as sent; the label service parses "true"/"false" strings as well as booleans
+            'print_date': data.get('print_date', False),
+            'print_time': data.get('print_time', False)
+        }).json().get('success', False)
+        return jsonify({"success": success})
+    except requests.RequestException as e:
+        print(f"Error sending label printer inventory batch request: {str(e)}")
+        return jsonify({"success": False})
+
 @app.route('/label/reload')
 def reload_label_paper():
     try:
-        success = requests.get('http://label-printer:1234/reload').json().get('success', False)
+        success = label_printer_client.get('/reload').json().get('success', False)
         return jsonify({"success": success})
     except requests.RequestException as e:
         print(f"Error sending label printer reload request: {str(e)}")
         return jsonify({"success": False})
 
+@app.route('/order/print', methods=['POST'])
+def print_order():
+    image_capture = 'trigger' in request.args
+
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "message": "Invalid request body"}), 400
+    order = data.get('order', '')
+    receipt = data.get('receipt')
+    if receipt is not None and not isinstance(receipt, dict):
+        return jsonify({"success": False, "message": "Receipt must be an object"}), 400
+    items = _parse_label_items(data.get('items', []))
+    if items is None:
+        return jsonify({"success": False, "message": "Items must be a list of objects"}), 400
+    if not receipt and not items:
+        return jsonify({"success": False, "message": "Receipt or items are required"}), 400
+    if (receipt and receipt_job_queue.is_full()) or (items and label_job_queue.is_full()):
+        return jsonify({"success": False, "message": "Print queue full"}), 503
+
+    # Both printers have their own queue worker, so the receipt and labels print concurrently
+    order_id = uuid.uuid4().hex
+    jobs = {}
+    if receipt:
+        upcs = receipt.get('upcs', '')
+        # The receipt service takes the UPCs as a JSON string, which also keeps the print cache key hashable
+        if isinstance(upcs, list):
+            upcs = json.dumps(upcs)
+        jobs["receipt"] = receipt_job_queue.submit({
+            "order": order,
+            "upcs": upcs,
+            "details": receipt.get('details', ''),
+            "message": receipt.get('message', ''),
+            "wait": receipt.get('wait', None)
+        }, group_id=order_id)
+    if items:
+        jobs["label_batch"] = label_job_queue.submit({"order": order, "items": items}, kind="label_batch", group_id=order_id)
+
+    if not all(jobs.values()):
+        # A queue filled up after the check; cancel the rest so a retry doesn't print half the order twice
+        job_queues = {"receipt": receipt_job_queue, "label_batch": label_job_queue}
+        for kind, job_id in jobs.items():
+            if job_id and job_queues[kind].cancel(job_id, "cancelled, order not fully queued"):
+                jobs[kind] = None
+        return jsonify({"success": False, "message": "Print queue full", "order_id": order_id, "jobs": jobs}), 503
+
+    image_error = image_capture and not dispatch_camera_trigger(request.args, next(iter(jobs.values())))
+
+    if image_capture:
+        return jsonify({"success": True, "message": "Order print jobs started", "order_id": order_id, "jobs": jobs, "image_error": image_error})
+    else:
+        return jsonify({"success": True, "message": "Order print jobs started", "order_id": order_id, "jobs": jobs})
+
+@app.route('/orders/<order_id>')
+def get_order_print(order_id):
+    jobs = print_job_journal.get_group(order_id)
+    if not jobs:
+        return jsonify({"success": False, "message": "Order not found"}), 404
+    return jsonify({"success": True, "order": summarize_group(jobs)})
+
+@app.route('/jobs/<job_id>')
+def get_print_job(job_id):
+    job = print_job_journal.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+    return jsonify({"success": True, "job": job})
+
 @app.route('/image/capture')
 def capture():
     trigger = request.args.get('trigger', '')
@@ -297,12 +514,12 @@ def light_control():
 
     try:
         print(f"Sending light {state} request to porchlight")
-        response = requests.get(f'http://porchlight:1234/{state}')
+        response = porchlight_client.get(f'/{state}')
         response.raise_for_status()
         return jsonify({"success": True, "message": response.json().get('message', 'Light state changed')})
     except requests.RequestException as e:
         print(f"Error sending light {state} request: {str(e)}")
-        return jsonify({"success": False, "message": response.json().get('message', 'Light state changed')})
+        return jsonify({"success": False, "message": f"Light {state} request failed"})
     
 @app.route('/store', methods=['POST'])
 def store_control():  
@@ -317,7 +534,7 @@ def store_control():
             print("Stopping wave from store control")
             stop_service('wave')
         print(f"Sending light {state} request to porchlight")
-        response = requests.get(f'http://porchlight:1234/{state}')
+        response = porchlight_client.get(f'/{state}')
         response.raise_for_status()
         return jsonify({"success": True})
     except requests.RequestException as e:
@@ -333,7 +550,7 @@ def wave_auth():
     if not access_token:
         return jsonify({"success": False, "message": "Access token is required"}), 400
     try:
-        result = requests.post('http://wave:1234/auth', json={'access_token': access_token}, timeout=5)
+        result = wave_client.post('/auth', json={'access_token': access_token}, timeout=5)
         result.raise_for_status() 
         return jsonify({"success": result.json().get('success', False), "message": result.json().get('message', 'Authentication completed')})
     except requests.exceptions.RequestException as e:
@@ -344,7 +561,7 @@ def wave_auth():
 def wave_status():
     if request.method == 'GET':
         try:
-            response = requests.get('http://wave:1234/status')
+            response = wave_client.get('/status')
             response.raise_for_status()
             return jsonify({"status": response.json().get('status', ''), "success": True})
         except requests.RequestException as e:
@@ -406,5 +623,8 @@ def wave_restart():
 
 if __name__ == '__main__':
     threading.Thread(target=byf_client.start_polling, daemon=True).start()
+    receipt_job_queue.start()
+    label_job_queue.start()
+    camera_dispatcher.start()
     
     app.run(host='0.0.0.0', port=80)
\ No newline at end of file
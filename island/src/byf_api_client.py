@@ -1,8 +1,12 @@
 import os
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from temp_sensor_manager import TempSensorManager
 from utils import restart_service
+from service_client import get_service_client
+from printer_pool import get_printer_pool
+from token_manager import TokenManager
 
 POLL_INTERVAL_S = 10
 ERROR_POLL_INTERVAL_S = 5
@@ -10,13 +14,13 @@ LABEL_PRINTER_RESTART_TIME_S = 15
 LABEL_PRINTER_TIME_BETWEEN_RESTARTS_S = 60
 RECEIPT_PRINTER_RESTART_TIME_S = 15
 RECEIPT_PRINTER_TIME_BETWEEN_RESTARTS_S = 60
+# The printer services rebind a replugged printer themselves; only restart if that hasn't worked
+PRINTER_NOT_FOUND_RESTART_AFTER_S = 300
 
 REQUEST_TIMEOUT_INTERNAL_S = 7
+STATUS_DEADLINE_S = 5
 REQUEST_TIMEOUT_EXTERNAL_S = 10
 
-TOKEN_EXPIRY_BUFFER_S = 15
-TOKEN_EXPIRY_BUFFER_S_PROACTIVE = 600
-
 VIDEO_MONITORING_INTERVAL_M = 1.5
 VIDEO_MONITORING_ON = False
 
@@ -29,9 +33,6 @@ class BYFAPIClient:
         self.device_id = os.environ['RESIN_DEVICE_UUID']
         self.device_name = os.environ['BALENA_DEVICE_NAME_AT_INIT']
         self.device_type = 'island'
-        self.access_token = None
-        self.token_expiry = 0 
-        self.last_token_refresh = 0
         self.state = None
         self.poll_interval = POLL_INTERVAL_S
         self.temp_sensor_manager = TempSensorManager()
@@ -39,15 +40,27 @@ class BYFAPIClient:
         self.label_printer_status = None
         self.label_printer_reason = None
         self.label_printer_last_restart = 0
+        self.label_printer_not_found_since = None
         self.receipt_printer_status = None
         self.receipt_printer_reason = None
         self.receipt_printer_last_restart = 0
+        self.receipt_printer_not_found_since = None
+        self.status_executor = ThreadPoolExecutor(max_workers=2)
+        self.status_futures = {}
         self.last_video_monitoring_attempt = 1
+        self.api_client = get_service_client('byf-api', base_url=self.api_url, timeout=REQUEST_TIMEOUT_EXTERNAL_S)
+        self.receipt_printer_client = get_service_client('receipt-printer')
+        self.label_printer_client = get_service_client('label-printer')
+        self.porchlight_client = get_service_client('porchlight')
+        self.reaper_client = get_service_client('reaper')
+        self.baywatch_client = get_service_client('baywatch')
+        self.receipt_printer_pool = get_printer_pool('receipt-printer')
+        self.label_printer_pool = get_printer_pool('label-printer')
+        self.token_manager = TokenManager(self.authenticate)
+        self.token_manager.start()
 
     def authenticate(self):
-        self.last_token_refresh = time.time()
-
-        auth_url = f"{self.api_url}/auth/v1/token?grant_type=password"
+        auth_path = "/auth/v1/token?grant_type=password"
         auth_data = {
             "email": self.user,
             "password": self.password
@@ -58,13 +71,14 @@ class BYFAPIClient:
         }
         
         try:
-            print(f"Authenticating with {auth_url}")
-            auth_response = requests.post(auth_url, json=auth_data, headers=auth_headers, timeout=REQUEST_TIMEOUT_EXTERNAL_S)
+            print(f"Authenticating with {self.api_url}{auth_path}")
+            auth_response = self.api_client.post(auth_path, json=auth_data, headers=auth_headers)
             auth_response.raise_for_status()
             auth_data = auth_response.json()
-            self.access_token = auth_data['access_token']
-            self.token_expiry = auth_data.get('expires_at', time.time() + 3600)
-            print(f"Authentication successful, token expires at {self.token_expiry}")
+            access_token = auth_data['access_token']
+            token_expiry = auth_data.get('expires_at', time.time() + 3600)
+            print(f"Authentication successful, token expires at {token_expiry}")
+            return access_token, token_expiry
         except requests.exceptions.RequestException as e:
             print(f"Authentication failed: {e}")
             raise
@@ -72,9 +86,10 @@ class BYFAPIClient:
     def get_state(self):
         self.handle_printer_status()
         
-        state_url = f"{self.api_url}/functions/v1/state"
+        state_path = "/functions/v1/state"
+        access_token = self.get_access_token()
         state_headers = {
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
         state_url_params = {
@@ -86,13 +101,11 @@ class BYFAPIClient:
             "receiptPrinterStatus": self.receipt_printer_status,
             "receiptPrinterReason": self.receipt_printer_reason,
         }
-
-        self.get_access_token()
         
         try:
-            print(f"Getting device state from {state_url}")
+            print(f"Getting device state from {self.api_url}{state_path}")
             temperature_events = self.temp_sensor_manager.get_events()
-            state_response = requests.post(state_url, headers=state_headers, params=state_url_params, json=temperature_events, timeout=REQUEST_TIMEOUT_EXTERNAL_S)
+            state_response = self.api_client.post(state_path, headers=state_headers, params=state_url_params, json=temperature_events)
             state_response.raise_for_status()
             self.state = state_response.json()
             self.process_state()
@@ -111,7 +124,7 @@ class BYFAPIClient:
 
             try:
                 print(f"Making sure lights are {state}")
-                response = requests.get(f'http://porchlight:1234/{state}', timeout=REQUEST_TIMEOUT_INTERNAL_S)
+                response = self.porchlight_client.get(f'/{state}', timeout=REQUEST_TIMEOUT_INTERNAL_S)
                 response.raise_for_status()
                 return True
             except requests.RequestException as e:
@@ -120,26 +133,21 @@ class BYFAPIClient:
         return False
     
     def get_access_token(self):
-        if self.should_proactively_refresh_token():
-            print("Proactively refreshing token")
-            self.authenticate()
-        if not self.is_token_valid():
-            print("Token expired, authenticating")
-            self.authenticate()
-        return self.access_token
-    
-    def is_token_valid(self):
-        return self.access_token and time.time() < (self.token_expiry - TOKEN_EXPIRY_BUFFER_S)
-    
-    def should_proactively_refresh_token(self):
-        if time.time() > self.last_token_refresh + 15:
-            if time.time() > (self.token_expiry - TOKEN_EXPIRY_BUFFER_S_PROACTIVE):
-                return True
-        return False
+        return self.token_manager.get_token()
 
     def handle_printer_status(self):
-        self.handle_label_printer_status()
-        self.handle_receipt_printer_status()
+        # Poll both printers in parallel; a printer that misses the deadline keeps its
+        # last known status and its in-flight check is reused on the next poll
+        for printer, handler in (("label", self.handle_label_printer_status), ("receipt", self.handle_receipt_printer_status)):
+            future = self.status_futures.get(printer)
+            if future is None or future.done():
+                self.status_futures[printer] = self.status_executor.submit(handler)
+        done, pending = wait(self.status_futures.values(), timeout=STATUS_DEADLINE_S)
+        for future in done:
+            if future.exception():
+                print(f"Error getting printer status: {future.exception()}")
+        if pending:
+            print(f"{len(pending)} printer status check(s) still running, using last known status")
         if self.label_printer_status == "ready" and self.receipt_printer_status == "ready":
             self.poll_interval = POLL_INTERVAL_S
         else:
@@ -155,34 +163,43 @@ class BYFAPIClient:
         reason = None
 
         try:
-            response = requests.get('http://receipt-printer:1234/status', timeout=REQUEST_TIMEOUT_INTERNAL_S)
+            response = self.receipt_printer_client.get('/status', timeout=REQUEST_TIMEOUT_INTERNAL_S)
             response.raise_for_status()
             status = response.json().get('status', None)
             reason = response.json().get('reason', None)
+            self.receipt_printer_pool.update(response.json().get('printers', {}))
         except requests.RequestException as e:
             print(f"Error getting receipt printer status: {str(e)}")
             status = "service_offline"
             reason = str(e)
+            self.receipt_printer_pool.update({})
         self.receipt_printer_status = status
         self.receipt_printer_reason = reason
 
-        if status == "not_found" and time_since_restart > RECEIPT_PRINTER_TIME_BETWEEN_RESTARTS_S:
+        if status != "not_found":
+            self.receipt_printer_not_found_since = None
+        elif self.receipt_printer_not_found_since is None:
+            self.receipt_printer_not_found_since = time.time()
+        elif (time.time() - self.receipt_printer_not_found_since > PRINTER_NOT_FOUND_RESTART_AFTER_S
+              and time_since_restart > RECEIPT_PRINTER_TIME_BETWEEN_RESTARTS_S):
             return self.restart_receipt_printer()
         
         return self.receipt_printer_status, self.receipt_printer_reason
     
     def restart_receipt_printer(self):
+        print(f"Receipt printer not found for over {PRINTER_NOT_FOUND_RESTART_AFTER_S} seconds, restarting service")
         self.receipt_printer_last_restart = time.time()
+        self.receipt_printer_not_found_since = None
         self.receipt_printer_status = "service_restarting"
         restart_service("receipt-printer")
         return self.receipt_printer_status, self.receipt_printer_reason
     
     def notify_print_success(self, order):
-        self.get_access_token()
+        access_token = self.get_access_token()
 
-        notify_url = f"{self.api_url}/functions/v1/print"
+        notify_path = "/functions/v1/print"
         notify_headers = {
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
         notify_body = {
@@ -190,7 +207,7 @@ class BYFAPIClient:
         }
 
         try:
-            notify_response = requests.post(notify_url, json=notify_body, headers=notify_headers, timeout=REQUEST_TIMEOUT_EXTERNAL_S)
+            notify_response = self.api_client.post(notify_path, json=notify_body, headers=notify_headers)
             notify_response.raise_for_status()
             print("[Receipt Printer] Successfully notified backend of print completion")
         except requests.exceptions.RequestException as e:
@@ -207,34 +224,43 @@ class BYFAPIClient:
         reason = None
 
         try:
-            response = requests.get('http://label-printer:1234/status', timeout=REQUEST_TIMEOUT_INTERNAL_S)
+            response = self.label_printer_client.get('/status', timeout=REQUEST_TIMEOUT_INTERNAL_S)
             response.raise_for_status()
             status = response.json().get('status', None)
             reason = response.json().get('reason', None)
+            self.label_printer_pool.update(response.json().get('printers', {}))
         except requests.RequestException as e:
             print(f"Error getting label printer status: {str(e)}")
             status = "service_offline"
             reason = str(e)
+            self.label_printer_pool.update({})
         self.label_printer_status = status
         self.label_printer_reason = reason
 
-        if status == "not_found" and time_since_restart > LABEL_PRINTER_TIME_BETWEEN_RESTARTS_S:
+        if status != "not_found":
+            self.label_printer_not_found_since = None
+        elif self.label_printer_not_found_since is None:
+            self.label_printer_not_found_since = time.time()
+        elif (time.time() - self.label_printer_not_found_since > PRINTER_NOT_FOUND_RESTART_AFTER_S
+              and time_since_restart > LABEL_PRINTER_TIME_BETWEEN_RESTARTS_S):
             return self.restart_label_printer()
         
         return self.label_printer_status, self.label_printer_reason
     
     def restart_label_printer(self):
+        print(f"Label printer not found for over {PRINTER_NOT_FOUND_RESTART_AFTER_S} seconds, restarting service")
         self.label_printer_last_restart = time.time()
+        self.label_printer_not_found_since = None
         self.label_printer_status = "service_restarting"
         restart_service("label-printer")
         return self.label_printer_status, self.label_printer_reason
     
     def notify_label_success(self, fulfillment):
-        self.get_access_token()
+        access_token = self.get_access_token()
 
-        notify_url = f"{self.api_url}/functions/v1/print-label"
+        notify_path = "/functions/v1/print-label"
         notify_headers = {
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
         notify_body = {
@@ -242,7 +268,7 @@ class BYFAPIClient:
         }
 
         try:
-            notify_response = requests.post(notify_url, json=notify_body, headers=notify_headers, timeout=REQUEST_TIMEOUT_EXTERNAL_S)
+            notify_response = self.api_client.post(notify_path, json=notify_body, headers=notify_headers)
             notify_response.raise_for_status()
             print("[Label Printer] Successfully notified backend of label print completion")
         except requests.exceptions.RequestException as e:
@@ -250,11 +276,11 @@ class BYFAPIClient:
             raise
 
     def notify_wave_status(self, status):
-        self.get_access_token()
+        access_token = self.get_access_token()
 
-        notify_url = f"{self.api_url}/functions/v1/wave-status"
+        notify_path = "/functions/v1/wave-status"
         notify_headers = {
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
         notify_body = {
@@ -262,7 +288,7 @@ class BYFAPIClient:
         }
 
         try:
-            notify_response = requests.post(notify_url, json=notify_body, headers=notify_headers, timeout=REQUEST_TIMEOUT_EXTERNAL_S)
+            notify_response = self.api_client.post(notify_path, json=notify_body, headers=notify_headers)
             notify_response.raise_for_status()
             print("[Wave] Successfully notified backend of wave status")
             return True
@@ -272,7 +298,7 @@ class BYFAPIClient:
         
     def keepalive(self):
         try:
-            response = requests.get('http://reaper:1234/keepalive', timeout=REQUEST_TIMEOUT_INTERNAL_S)
+            response = self.reaper_client.get('/keepalive', timeout=REQUEST_TIMEOUT_INTERNAL_S)
             response.raise_for_status()
             return True
         except requests.RequestException as e:
@@ -283,7 +309,7 @@ class BYFAPIClient:
         self.last_video_monitoring_attempt = time.time()
         access_token = self.get_access_token()
         try:
-            response = requests.get(f'http://baywatch:1234/record?token={access_token}&trigger=monitoring', timeout=REQUEST_TIMEOUT_INTERNAL_S)
+            response = self.baywatch_client.get('/record', params={'token': access_token, 'trigger': 'monitoring'}, timeout=REQUEST_TIMEOUT_INTERNAL_S)
             response.raise_for_status()
             return True
         except requests.RequestException as e:
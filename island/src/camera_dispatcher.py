@@ -0,0 +1,40 @@
+import queue
+import threading
+import time
+
+MAX_PENDING_TRIGGERS = 20
+DISPATCH_WORKERS = 2
+
+class CameraDispatcher:
+    def __init__(self, journal, max_pending=MAX_PENDING_TRIGGERS, workers=DISPATCH_WORKERS):
+        self.journal = journal
+        self.triggers = queue.Queue(maxsize=max_pending)
+        self.workers = workers
+
+    def dispatch(self, handler, trigger, job_id=None):
+        try:
+            self.triggers.put_nowait((handler, trigger, job_id, time.time()))
+            return True
+        except queue.Full:
+            print(f"Camera trigger queue full, dropping {trigger} trigger")
+            if job_id:
+                self.journal.update_camera(job_id, {"success": False, "message": "Camera trigger queue full"})
+            return False
+
+    def process_triggers(self):
+        while True:
+            handler, trigger, job_id, queued_at = self.triggers.get()
+            try:
+                result = handler(trigger)
+            except Exception as e:
+                print(f"Error sending camera trigger {trigger}: {str(e)}")
+                result = {"success": False, "message": str(e)}
+            finally:
+                self.triggers.task_done()
+            if job_id:
+                result["delay_s"] = round(time.time() - queued_at, 3)
+                self.journal.update_camera(job_id, result)
+
+    def start(self):
+        for _ in range(self.workers):
+            threading.Thread(target=self.process_triggers, daemon=True).start()
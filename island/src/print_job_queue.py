@@ -0,0 +1,241 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+JOB_DB_PATH = os.environ.get('PRINT_JOB_DB_PATH', '/data/print_jobs.db')
+MAX_PENDING_JOBS = 50
+JOB_WORKERS = 1
+JOB_RETENTION_S = 24 * 60 * 60
+# Tickets queued longer ago than this are stale by the time the service is back
+JOB_RESTORE_MAX_AGE_S = 5 * 60
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_PRINTING = "printing"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+
+class PrintJobJournal:
+    def __init__(self, db_path=JOB_DB_PATH):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                printer TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                success INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_printer_status ON jobs (printer, status)")
+        self.migrate()
+        self.prune()
+
+    def migrate(self):
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)").fetchall()]
+        if "camera" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN camera TEXT")
+        if "kind" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN kind TEXT")
+        if "group_id" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN group_id TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_group_id ON jobs (group_id)")
+        if "started_at" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN started_at REAL")
+
+    def add_job(self, printer, kind, params, group_id=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, printer, kind, params, status, group_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, printer, kind, json.dumps(params), JOB_STATUS_QUEUED, group_id, now, now)
+            )
+        return job_id
+
+    def update_job(self, job_id, status, success=None, error=None):
+        with self.lock:
+            if status == JOB_STATUS_PRINTING:
+                self.conn.execute("UPDATE jobs SET started_at = ? WHERE id = ?", (time.time(), job_id))
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, success = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, success, error, time.time(), job_id)
+            )
+
+    def update_camera(self, job_id, result):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET camera = ? WHERE id = ?",
+                (json.dumps(result), job_id)
+            )
+
+    def get_job(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self.row_to_job(row) if row else None
+
+    def get_group(self, group_id):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM jobs WHERE group_id = ? ORDER BY created_at", (group_id,)).fetchall()
+        return [self.row_to_job(row) for row in rows]
+
+    def get_unfinished_jobs(self, printer):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE printer = ? AND status IN (?, ?) ORDER BY created_at",
+                (printer, JOB_STATUS_QUEUED, JOB_STATUS_PRINTING)
+            ).fetchall()
+        return [self.row_to_job(row) for row in rows]
+
+    def prune(self):
+        cutoff = time.time() - JOB_RETENTION_S
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JOB_STATUS_DONE, JOB_STATUS_FAILED, cutoff)
+            )
+
+    def row_to_job(self, row):
+        return {
+            "id": row["id"],
+            "printer": row["printer"],
+            "kind": row["kind"],
+            "params": json.loads(row["params"]),
+            "status": row["status"],
+            "success": None if row["success"] is None else bool(row["success"]),
+            "error": row["error"],
+            "camera": json.loads(row["camera"]) if row["camera"] else None,
+            "group_id": row["group_id"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "updated_at": row["updated_at"]
+        }
+
+def summarize_group(jobs):
+    statuses = set(job["status"] for job in jobs)
+    finished = statuses <= {JOB_STATUS_DONE, JOB_STATUS_FAILED}
+    if statuses == {JOB_STATUS_DONE}:
+        status = JOB_STATUS_DONE
+    elif finished:
+        status = JOB_STATUS_FAILED
+    elif statuses == {JOB_STATUS_QUEUED}:
+        status = JOB_STATUS_QUEUED
+    else:
+        status = JOB_STATUS_PRINTING
+    created_at = min(job["created_at"] for job in jobs)
+    finished_at = max(job["updated_at"] for job in jobs) if finished else None
+    return {
+        "status": status,
+        "success": status == JOB_STATUS_DONE if finished else None,
+        "created_at": created_at,
+        "finished_at": finished_at,
+        "duration_s": round(finished_at - created_at, 3) if finished else None,
+        "camera": next((job["camera"] for job in jobs if job["camera"]), None),
+        "jobs": {
+            job["kind"] or job["printer"]: {
+                "id": job["id"],
+                "status": job["status"],
+                "success": job["success"],
+                "wait_s": round(job["started_at"] - job["created_at"], 3) if job["started_at"] else None,
+                "print_s": round(job["updated_at"] - job["started_at"], 3) if job["started_at"] and job["status"] in (JOB_STATUS_DONE, JOB_STATUS_FAILED) else None
+            } for job in jobs
+        }
+    }
+
+class PrintJobQueue:
+    def __init__(self, printer, handlers, journal, max_pending=MAX_PENDING_JOBS, workers=JOB_WORKERS):
+        self.printer = printer
+        # One worker per physical printer, so jobs can print side by side
+        self.workers = workers
+        self.handlers = handlers
+        # Jobs journaled before job kinds existed use the first handler
+        self.default_kind = next(iter(handlers))
+        self.journal = journal
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.submit_lock = threading.Lock()
+        self.cancelled = set()
+
+    def is_full(self):
+        return self.jobs.full()
+
+    def submit(self, params, kind=None, group_id=None):
+        kind = kind or self.default_kind
+        with self.submit_lock:
+            if self.jobs.full():
+                print(f"[{self.printer}] Print queue full, rejecting job")
+                return None
+            job_id = self.journal.add_job(self.printer, kind, params, group_id)
+            self.jobs.put_nowait((job_id, kind, params))
+        print(f"[{self.printer}] Queued print job {job_id} ({self.jobs.qsize()} pending)")
+        return job_id
+
+    def cancel(self, job_id, reason):
+        # Only jobs still waiting in the queue can be cancelled
+        with self.submit_lock:
+            job = self.journal.get_job(job_id)
+            if not job or job["status"] != JOB_STATUS_QUEUED:
+                return False
+            self.cancelled.add(job_id)
+            self.journal.update_job(job_id, JOB_STATUS_FAILED, False, reason)
+        print(f"[{self.printer}] Cancelled print job {job_id}: {reason}")
+        return True
+
+    def get_job(self, job_id):
+        return self.journal.get_job(job_id)
+
+    def restore_jobs(self):
+        now = time.time()
+        for job in self.journal.get_unfinished_jobs(self.printer):
+            # The printer may already have printed it before the service died; don't print it twice
+            if job["status"] == JOB_STATUS_PRINTING:
+                print(f"[{self.printer}] Print job {job['id']} was interrupted while printing, not replaying it")
+                self.journal.update_job(job["id"], JOB_STATUS_FAILED, False, "interrupted while printing")
+                continue
+            if now - job["created_at"] > JOB_RESTORE_MAX_AGE_S:
+                print(f"[{self.printer}] Print job {job['id']} expired, not restoring it")
+                self.journal.update_job(job["id"], JOB_STATUS_FAILED, False, "expired on restore")
+                continue
+            try:
+                self.jobs.put_nowait((job["id"], job["kind"] or self.default_kind, job["params"]))
+                print(f"[{self.printer}] Restored print job {job['id']} from journal")
+            except queue.Full:
+                print(f"[{self.printer}] Print queue full, dropping restored job {job['id']}")
+                self.journal.update_job(job["id"], JOB_STATUS_FAILED, False, "queue full on restore")
+
+    def process_jobs(self):
+        while True:
+            job_id, kind, params = self.jobs.get()
+            with self.submit_lock:
+                if job_id in self.cancelled:
+                    self.cancelled.discard(job_id)
+                    self.jobs.task_done()
+                    continue
+                self.journal.update_job(job_id, JOB_STATUS_PRINTING)
+            try:
+                success = bool(self.handlers[kind](**params))
+                status = JOB_STATUS_DONE if success else JOB_STATUS_FAILED
+                self.journal.update_job(job_id, status, success)
+            except Exception as e:
+                print(f"[{self.printer}] Print job {job_id} error: {str(e)}")
+                self.journal.update_job(job_id, JOB_STATUS_FAILED, False, str(e))
+            finally:
+                self.jobs.task_done()
+
+    def start(self):
+        self.restore_jobs()
+        for _ in range(self.workers):
+            threading.Thread(target=self.process_jobs, daemon=True).start()
@@ -0,0 +1,79 @@
+import threading
+import requests
+
+# Lower ranks are preferred; printers in any other state don't get jobs
+ROUTABLE_STATUSES = {"ready": 0, "low_paper": 1}
+# A job that failed on a printer in one of these states didn't print, so it can move to another printer
+FAILOVER_STATUSES = {"no_paper", "printer_offline", "error", "not_found"}
+
+class PrinterPool:
+    def __init__(self, service):
+        self.service = service
+        self.printers = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def update(self, printers):
+        with self.lock:
+            self.printers = {printer_id: dict(status) for printer_id, status in printers.items()}
+
+    def mark(self, printer_id, status):
+        with self.lock:
+            if printer_id in self.printers:
+                self.printers[printer_id]["status"] = status
+
+    def forget(self, printer_id):
+        with self.lock:
+            self.printers.pop(printer_id, None)
+
+    def acquire(self, exclude=()):
+        # None lets the service pick, e.g. before the first status poll
+        with self.lock:
+            candidates = [printer_id for printer_id, printer in self.printers.items()
+                          if printer.get("status") in ROUTABLE_STATUSES and printer_id not in exclude]
+            if not candidates:
+                return None
+            printer_id = min(candidates, key=lambda printer_id: (ROUTABLE_STATUSES[self.printers[printer_id]["status"]],
+                                                                 self.in_flight.get(printer_id, 0)))
+            self.in_flight[printer_id] = self.in_flight.get(printer_id, 0) + 1
+            return printer_id
+
+    def release(self, printer_id):
+        if printer_id is None:
+            return
+        with self.lock:
+            self.in_flight[printer_id] = max(self.in_flight.get(printer_id, 0) - 1, 0)
+
+    def submit(self, send):
+        # send(printer_id) makes the request and returns the service's JSON response
+        tried = []
+        while True:
+            printer_id = self.acquire(exclude=tried)
+            try:
+                result = send(printer_id)
+            except requests.exceptions.HTTPError as e:
+                # The service no longer knows this id, e.g. it rediscovered its printers after a restart
+                if printer_id is None or e.response is None or e.response.status_code != 404:
+                    raise
+                print(f"[{self.service}] Printer {printer_id} is unknown to the service, failing over")
+                self.forget(printer_id)
+                tried.append(printer_id)
+                continue
+            finally:
+                self.release(printer_id)
+            status = result.get("status")
+            # Don't fail over a batch that got partway, or its printed labels would be printed twice
+            if result.get("success") or printer_id is None or status not in FAILOVER_STATUSES or any(result.get("results") or []):
+                return result
+            print(f"[{self.service}] Printer {printer_id} is {status}, failing over")
+            self.mark(printer_id, status)
+            tried.append(printer_id)
+
+pools = {}
+pools_lock = threading.Lock()
+
+def get_printer_pool(service):
+    with pools_lock:
+        if service not in pools:
+            pools[service] = PrinterPool(service)
+        return pools[service]
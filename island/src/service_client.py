@@ -0,0 +1,92 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+SERVICE_PORT = 1234
+POOL_MAXSIZE = 4
+
+DEFAULT_TIMEOUT_S = 7
+# (connect, read) timeouts for endpoints that legitimately take longer than a status check
+ENDPOINT_TIMEOUTS_S = {
+    ("receipt-printer", "/print"): (3, 60),
+    ("receipt-printer", "/configure"): (3, 30),
+    ("receipt-printer", "/reload"): (3, 30),
+    ("label-printer", "/print"): (3, 60),
+    ("label-printer", "/print_batch"): (3, 180),
+    ("label-printer", "/print_text"): (3, 30),
+    ("label-printer", "/inventory"): (3, 60),
+    ("label-printer", "/inventory_batch"): (3, 120),
+    ("label-printer", "/configure"): (3, 30),
+    ("label-printer", "/reload"): (3, 30),
+}
+
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_S = 15
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+class ServiceClient:
+    def __init__(self, service, base_url=None, timeout=DEFAULT_TIMEOUT_S):
+        self.service = service
+        self.base_url = base_url or f"http://{service}:{SERVICE_PORT}"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = 0
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def request(self, method, path, timeout=None, **kwargs):
+        self.check_circuit()
+        if timeout is None:
+            timeout = ENDPOINT_TIMEOUTS_S.get((self.service, path), self.timeout)
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=timeout, **kwargs)
+        except requests.exceptions.ConnectionError:
+            # Connect timeouts and refused connections only; a read timeout means the service is up
+            # but slow, e.g. /status waiting behind a long print job, and must not open the circuit
+            self.record_failure()
+            raise
+        self.record_success()
+        return response
+
+    def check_circuit(self):
+        with self.lock:
+            if self.failures < CIRCUIT_FAILURE_THRESHOLD:
+                return
+            if time.time() - self.opened_at < CIRCUIT_RESET_S:
+                raise CircuitOpenError(f"{self.service} unavailable, circuit open")
+            # Half-open: let this request through as a probe
+            self.opened_at = time.time()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures == CIRCUIT_FAILURE_THRESHOLD:
+                print(f"[{self.service}] {self.failures} consecutive failures, opening circuit for {CIRCUIT_RESET_S} seconds")
+                self.opened_at = time.time()
+
+    def record_success(self):
+        with self.lock:
+            if self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                print(f"[{self.service}] Service recovered, closing circuit")
+            self.failures = 0
+
+clients = {}
+clients_lock = threading.Lock()
+
+def get_service_client(service, base_url=None, timeout=DEFAULT_TIMEOUT_S):
+    with clients_lock:
+        if service not in clients:
+            clients[service] = ServiceClient(service, base_url, timeout)
+        return clients[service]
@@ -0,0 +1,93 @@
+import os
+import json
+import threading
+import time
+
+TOKEN_CACHE_PATH = os.environ.get('BYF_TOKEN_CACHE_PATH', '/data/byf_token.json')
+TOKEN_EXPIRY_BUFFER_S = 15
+TOKEN_EXPIRY_BUFFER_S_PROACTIVE = 600
+MIN_REFRESH_INTERVAL_S = 15
+REFRESH_RETRY_INTERVAL_S = 30
+
+class TokenManager:
+    def __init__(self, fetch_token, cache_path=TOKEN_CACHE_PATH):
+        self.fetch_token = fetch_token
+        self.cache_path = cache_path
+        self.access_token = None
+        self.token_expiry = 0
+        self.last_token_refresh = 0
+        self.token_refreshed_at = 0
+        self.refresh_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.load_cached_token()
+
+    def load_cached_token(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                cached = json.load(f)
+            if cached['expires_at'] - TOKEN_EXPIRY_BUFFER_S > time.time():
+                self.access_token = cached['access_token']
+                self.token_expiry = cached['expires_at']
+                print(f"Loaded cached token, expires at {self.token_expiry}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Failed to load cached token: {e}")
+
+    def save_cached_token(self):
+        try:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"access_token": self.access_token, "expires_at": self.token_expiry}, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Failed to save cached token: {e}")
+
+    def is_token_valid(self):
+        return self.access_token and time.time() < (self.token_expiry - TOKEN_EXPIRY_BUFFER_S)
+
+    def get_token(self):
+        # Hot path: return the current token without touching the network
+        if self.is_token_valid():
+            return self.access_token
+        print("Token expired, authenticating")
+        return self.refresh()
+
+    def refresh(self):
+        requested_at = time.time()
+        with self.refresh_lock:
+            # Another thread finished a refresh while we waited for the lock
+            if self.token_refreshed_at >= requested_at and self.is_token_valid():
+                return self.access_token
+            self.last_token_refresh = time.time()
+            self.access_token, self.token_expiry = self.fetch_token()
+            self.token_refreshed_at = time.time()
+            self.save_cached_token()
+        self.wakeup.set()
+        return self.access_token
+
+    def seconds_until_refresh(self):
+        now = time.time()
+        return max(self.token_expiry - TOKEN_EXPIRY_BUFFER_S_PROACTIVE - now,
+                   self.last_token_refresh + MIN_REFRESH_INTERVAL_S - now)
+
+    def refresh_periodically(self):
+        while True:
+            wait_s = self.seconds_until_refresh()
+            if wait_s > 0:
+                self.wakeup.wait(wait_s)
+                self.wakeup.clear()
+                continue
+            try:
+                print("Proactively refreshing token")
+                self.refresh()
+            except Exception as e:
+                print(f"Proactive token refresh failed: {e}")
+                time.sleep(REFRESH_RETRY_INTERVAL_S)
+
+    def start(self):
+        threading.Thread(target=self.refresh_periodically, daemon=True).start()
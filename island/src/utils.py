@@ -1,5 +1,11 @@
 import os
 import requests
+from service_client import get_service_client
+
+SUPERVISOR_TIMEOUT_S = 10
+
+def get_supervisor_client(supervisor_address):
+    return get_service_client('supervisor', base_url=supervisor_address, timeout=SUPERVISOR_TIMEOUT_S)
 
 def restart_service(service_name):
     print(f"Restarting {service_name} service")
@@ -11,11 +17,11 @@ def restart_service(service_name):
         print("Error: Missing required environment variables")
         return
 
-    url = f"{supervisor_address}/v2/applications/{app_id}/restart-service?apikey={api_key}"
+    path = f"/v2/applications/{app_id}/restart-service?apikey={api_key}"
     payload = {"serviceName": service_name}
     
     try:
-        response = requests.post(url, json=payload)
+        response = get_supervisor_client(supervisor_address).post(path, json=payload)
         response.raise_for_status()
         print(f"{service_name} restart request sent successfully")
     except requests.exceptions.RequestException as e:
@@ -31,11 +37,11 @@ def stop_service(service_name):
         print("Error: Missing required environment variables")
         return
 
-    url = f"{supervisor_address}/v2/applications/{app_id}/stop-service?apikey={api_key}"
+    path = f"/v2/applications/{app_id}/stop-service?apikey={api_key}"
     payload = {"serviceName": service_name}
     
     try:
-        response = requests.post(url, json=payload)
+        response = get_supervisor_client(supervisor_address).post(path, json=payload)
         response.raise_for_status()
         print(f"{service_name} stop request sent successfully")
     except requests.exceptions.RequestException as e:
@@ -51,11 +57,11 @@ def start_service(service_name):
         print("Error: Missing required environment variables")
         return
 
-    url = f"{supervisor_address}/v2/applications/{app_id}/start-service?apikey={api_key}"
+    path = f"/v2/applications/{app_id}/start-service?apikey={api_key}"
     payload = {"serviceName": service_name}
     
     try:
-        response = requests.post(url, json=payload)
+        response = get_supervisor_client(supervisor_address).post(path, json=payload)
         response.raise_for_status()
         print(f"{service_name} start request sent successfully")
     except requests.exceptions.RequestException as e:
@@ -70,10 +76,10 @@ def get_service_status(service_name):
         print("Error: Missing required environment variables")
         return
 
-    url = f"{supervisor_address}/v2/applications/state?apikey={api_key}"
+    path = f"/v2/applications/state?apikey={api_key}"
     
     try:
-        response = requests.get(url)
+        response = get_supervisor_client(supervisor_address).get(path)
         response.raise_for_status()
         data = response.json()
         
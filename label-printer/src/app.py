@@ -1,5 +1,6 @@
 from flask import Flask, jsonify, request
-from label_printer_manager import LabelPrinterManager
+from label_printer_manager import create_label_printer_managers
+from device_pool import DevicePool
 import threading
 import requests
 import time
@@ -7,12 +8,19 @@ import time
 LABEL_DEBUG_MODE = False
 
 app = Flask(__name__)
-label_printer_manager = LabelPrinterManager()
+label_printers = DevicePool(create_label_printer_managers())
+
+def unknown_printer():
+    return jsonify({"success": False, "message": "Unknown printer"}), 404
+
+def result(manager, success, **kwargs):
+    # Island routes the next job and fails over based on the printer and its status
+    return jsonify(dict({"success": success, "printer": manager.printer_id, "status": manager.last_status}, **kwargs))
 
 @app.route('/status')
 def get_label_printer_status():
     try:
-        return jsonify(label_printer_manager.get_status())
+        return jsonify(label_printers.get_status())
     except Exception as e:
         return jsonify({"status": "unknown", "reason": f"exception: {str(e)}"})
 
@@ -20,7 +28,10 @@ def get_label_printer_status():
 def configure_label_printer():
     buzzer = request.args.get('buzzer', 'false') == 'true'
     paper_removal_standby = request.args.get('paper_removal_standby', 'false') == 'true'
-    success = label_printer_manager.configure_printer(buzzer, paper_removal_standby)
+    managers = label_printers.select(request.args.get('printer'))
+    if not managers:
+        return unknown_printer()
+    success = all([manager.configure_printer(buzzer, paper_removal_standby) for manager in managers])
     return jsonify({"success": success})
 
 @app.route('/print')
@@ -33,14 +44,34 @@ def print_label():
     fulfillment = request.args.get('fulfillment')
     paid = request.args.get('paid', 'false') == 'true'
 
-    success = label_printer_manager.print_label(order, item, upcs, item_number, item_total, fulfillment, paid)
-    return jsonify({"success": success})
+    manager = label_printers.get(request.args.get('printer'))
+    if not manager:
+        return unknown_printer()
+    success = manager.print_label(order, item, upcs, item_number, item_total, fulfillment, paid)
+    return result(manager, success)
+
+@app.route('/print_batch', methods=['POST'])
+def print_label_batch():
+    data = request.json or {}
+    order = data.get('order', '')
+    items = data.get('items', [])
+    if not items:
+        return jsonify({"success": False, "message": "Items are required"}), 400
+
+    manager = label_printers.get(data.get('printer'))
+    if not manager:
+        return unknown_printer()
+    results = manager.print_label_batch(order, items)
+    return result(manager, all(results), results=results)
 
 @app.route('/print_text')
 def print_text():
     text = request.args.get('text')
-    success = label_printer_manager.print_text(text)
-    return jsonify({"success": success})
+    manager = label_printers.get(request.args.get('printer'))
+    if not manager:
+        return unknown_printer()
+    success = manager.print_text(text)
+    return result(manager, success)
 
 @app.route('/inventory')
 def print_inventory_label():
@@ -48,13 +79,39 @@ def print_inventory_label():
     print_date = request.args.get('print_date', False)
     print_time = request.args.get('print_time', False)
     quantity = request.args.get('quantity', 2)
-    success = label_printer_manager.print_inventory_label(item, print_date, print_time, quantity)
+    manager = label_printers.get(request.args.get('printer'))
+    if not manager:
+        return unknown_printer()
+    success = manager.print_inventory_label(item, print_date, print_time, quantity)
+    return result(manager, success)
+
+@app.route('/assets/sync')
+def sync_label_assets():
+    managers = label_printers.select(request.args.get('printer'))
+    if not managers:
+        return unknown_printer()
+    success = all([manager.sync_nv_assets() for manager in managers])
     return jsonify({"success": success})
 
+@app.route('/inventory_batch', methods=['POST'])
+def print_inventory_batch():
+    data = request.json or {}
+    items = data.get('items', [])
+    print_date = data.get('print_date', False)
+    print_time = data.get('print_time', False)
+    manager = label_printers.get(data.get('printer'))
+    if not manager:
+        return unknown_printer()
+    success = manager.print_inventory_batch(items, print_date, print_time)
+    return result(manager, success)
+
 @app.route('/reload')
 def reload_label_paper():
-    success = label_printer_manager.reload_paper()
-    return jsonify({"success": success})
+    manager = label_printers.get(request.args.get('printer'))
+    if not manager:
+        return unknown_printer()
+    success = manager.reload_paper()
+    return result(manager, success)
 
 def send_label_debug_request():
     time.sleep(5)
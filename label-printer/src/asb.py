@@ -0,0 +1,82 @@
+# Automatic Status Back (ASB) support for Epson printers
+GS = b'\x1D'
+ENABLE_ASB = GS + b'\x61'  # GS a n
+DISABLE_ASB = ENABLE_ASB + b'\x00'
+
+# n: bit 1 = online/offline, bit 2 = error, bit 3 = roll paper sensor
+ASB_STATUS_FLAGS = 0b00001110
+
+ASB_PACKET_LENGTH = 4
+# First byte: bits 0, 1, 4 and 7 are fixed (0, 0, 1, 0)
+ASB_HEADER_MASK = 0b10010011
+ASB_HEADER_VALUE = 0b00010000
+
+# Byte 1
+ASB_OFFLINE_BIT = 0b00001000
+ASB_COVER_OPEN_BIT = 0b00100000
+ASB_PAPER_FEED_BUTTON_BIT = 0b01000000
+# Byte 2
+ASB_RECOVERABLE_ERROR_BIT = 0b00000100
+ASB_AUTOCUTTER_ERROR_BIT = 0b00001000
+ASB_UNRECOVERABLE_ERROR_BIT = 0b00100000
+ASB_AUTORECOVERABLE_ERROR_BIT = 0b01000000
+# Byte 3
+ASB_PAPER_LOW_BITS = 0b00000011
+ASB_PAPER_OUT_BITS = 0b00001100
+
+def enable_asb_command(flags=ASB_STATUS_FLAGS):
+    return ENABLE_ASB + bytes([flags])
+
+def is_asb_header(byte):
+    return (byte & ASB_HEADER_MASK) == ASB_HEADER_VALUE
+
+def find_asb_packets(data):
+    packets = []
+    i = 0
+    while i + ASB_PACKET_LENGTH <= len(data):
+        if is_asb_header(data[i]):
+            packets.append(bytes(data[i:i + ASB_PACKET_LENGTH]))
+            i += ASB_PACKET_LENGTH
+        else:
+            i += 1
+    return packets
+
+def decode_asb(packet):
+    status_byte, error_byte, paper_byte = packet[0], packet[1], packet[2]
+    return {
+        'offline': bool(status_byte & ASB_OFFLINE_BIT),
+        'cover_open': bool(status_byte & ASB_COVER_OPEN_BIT),
+        'paper_feed_button': bool(status_byte & ASB_PAPER_FEED_BUTTON_BIT),
+        'recoverable': bool(error_byte & ASB_RECOVERABLE_ERROR_BIT),
+        'autocutter': bool(error_byte & ASB_AUTOCUTTER_ERROR_BIT),
+        'unrecoverable': bool(error_byte & ASB_UNRECOVERABLE_ERROR_BIT),
+        'autorecoverable': bool(error_byte & ASB_AUTORECOVERABLE_ERROR_BIT),
+        'paper_low': (paper_byte & ASB_PAPER_LOW_BITS) == ASB_PAPER_LOW_BITS,
+        'paper_out': (paper_byte & ASB_PAPER_OUT_BITS) == ASB_PAPER_OUT_BITS
+    }
+
+def status_from_asb(asb, report_paper_low=True):
+    reason = None
+    if asb['paper_out']:
+        return "no_paper", reason
+    if not asb['offline']:
+        if report_paper_low and asb['paper_low']:
+            return "low_paper", reason
+        return "ready", reason
+
+    status = "printer_offline"
+    if asb['cover_open']:
+        reason = "cover_open"
+    elif asb['paper_feed_button']:
+        reason = "paper_feed_button"
+    elif asb['autorecoverable'] or asb['unrecoverable'] or asb['recoverable'] or asb['autocutter']:
+        status = "error"
+        if asb['autorecoverable']:
+            reason = "autorecoverable"
+        elif asb['unrecoverable']:
+            reason = "unrecoverable"
+        elif asb['recoverable']:
+            reason = "recoverable"
+        elif asb['autocutter']:
+            reason = "autocutter"
+    return status, reason
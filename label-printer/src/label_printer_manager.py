@@ -1,18 +1,28 @@
 import time
-from escpos.printer import Usb
+from escpos.printer import Dummy
 from escpos.constants import QR_ECLEVEL_M
 from escpos.exceptions import DeviceNotFoundError
 import threading
+import os
 import json
 from utils import format_string
+from usb_transport import PersistentUsb, find_serial_numbers
+from network_transport import PersistentNetwork
+from asb import enable_asb_command, find_asb_packets, decode_asb, status_from_asb
+from print_completion import process_id_for, process_id_command, process_response
+from user_settings import settings_store_path, UserSettingsStore, apply_settings
+from nv_graphics import asset_store_path, NVAssetStore, define_nv_graphic_command, print_nv_graphic_command, read_key_codes, hash_file
 from datetime import datetime, timezone
 import pytz
+from PIL import Image
 
 FEEDBACK_URL = "https://goodbear.co/feedback"
 # ~270x50 PNG, black on transparent
 LOGO_PATH = "label-logo.png"
 SMILEY_1_PATH = "label-happy-smiley.png"
 SMILEY_2_PATH = "label-tender-smiley.png"
+SMILEY_STRIP_PATHS = [SMILEY_1_PATH, SMILEY_2_PATH, SMILEY_1_PATH, SMILEY_2_PATH]
+SMILEY_STRIP_GAP_DOTS = 68  # matches ln(2) at the default 1/6" line spacing
 LOGO_FRAGMENT_HEIGHT = 20
 LOGO_SLEEP_BETWEEN_FRAGMENTS_MS = 0
 SLEEP_BETWEEN_SEGMENTS_MS = 50
@@ -24,8 +34,57 @@ PROFILE = "TM-L90"  # Wrong profile for the TM-L100, but no issues so far
 PRINT_COOLDOWN = 4
 POLL_COOLDOWN = 2
 TIMEOUT = 30
-TRANSMIT_READ_DELAY_MS = 100
 CONFIGURATION_SLEEP_TIME = 10
+CONFIGURATION_POLL_INTERVAL_S = 0.5
+# Comma-separated USB serial numbers; empty binds to any single printer
+LABEL_PRINTER_SERIALS = os.environ.get("LABEL_PRINTER_SERIALS", "")
+# Comma-separated host[:port] addresses of printers on the network (raw TCP, port 9100 by default)
+LABEL_PRINTER_HOSTS = os.environ.get("LABEL_PRINTER_HOSTS", "")
+DEFAULT_PRINTER_ID = "default"
+
+# GS ( E customized settings
+BUZZER_SETTING = 119
+BUZZER_OFF = 0  # 1 for external
+BUZZER_INTERNAL = 2
+PAPER_REMOVAL_STANDBY_SETTING = 14
+PAPER_REMOVAL_STANDBY_OFF = 0
+PAPER_REMOVAL_STANDBY_ON = 64
+PRINT_SPEED_SETTING = 6
+PRINT_SPEED = 2  # 1 (slow) - 11 (fast). Need to go slow when using high-tack paper.
+
+# Automatic Status Back settings
+ASB_MODE = os.environ.get("LABEL_PRINTER_ASB", "true").lower() == "true"
+ASB_READ_INTERVAL_S = 1
+ASB_READ_TIMEOUT_MS = 50
+ASB_FIRST_PACKET_TIMEOUT_MS = 1000
+ASB_RETRY_INTERVAL_S = 60
+
+# NV graphics settings
+NV_GRAPHICS_MODE = os.environ.get("LABEL_PRINTER_NV_GRAPHICS", "true").lower() == "true"
+NV_LOGO_KEY = b'LL'
+NV_SMILEY_1_KEY = b'S1'
+NV_SMILEY_2_KEY = b'S2'
+NV_ASSETS = {
+    NV_LOGO_KEY: LOGO_PATH,
+    NV_SMILEY_1_KEY: SMILEY_1_PATH,
+    NV_SMILEY_2_KEY: SMILEY_2_PATH
+}
+NV_DEFINE_TIMEOUT_MS = 30000
+NV_KEY_CODES_TIMEOUT_MS = 500
+NV_SYNC_RETRY_INTERVAL_S = 300
+WRITE_CHUNK_SIZE = 4096
+WRITE_TIMEOUT_MS = 10000
+INVENTORY_MAX_QUANTITY = 4
+INVENTORY_BATCH_MAX_LABELS = 40
+IMAGE_SETTINGS = {
+    "high_density_vertical": True,
+    "high_density_horizontal": True,
+    "impl": "bitImageRaster",
+    "fragment_height": LOGO_FRAGMENT_HEIGHT,
+    "center": False
+}
+COMPLETION_TIMEOUT_S = 30
+COMPLETION_READ_TIMEOUT_MS = 100
 
 # TM-L00 printer status constants
 TRANSMIT_STATUS = b'\x10\x04'
@@ -61,99 +120,102 @@ TRANSMIT_PAPER_STATUS = TRANSMIT_STATUS + b'\x04'
 VALID_PAPER_STATUSES = [0b00010010, 0b01110010]
 PAPER_OUT_MASK = 0b01110010
 
+def create_label_printer_managers():
+    addresses = [address.strip() for address in LABEL_PRINTER_HOSTS.split(",") if address.strip()]
+    managers = {address: LabelPrinterManager(address=address) for address in addresses}
+    serials = [serial.strip() for serial in LABEL_PRINTER_SERIALS.split(",") if serial.strip()]
+    if not serials:
+        found = find_serial_numbers(MAKE, MODEL)
+        serials = found if len(found) > 1 else []
+        # A lone USB printer isn't bound to its serial, so swapping it needs no configuration
+        if not serials and (found or not managers):
+            managers[DEFAULT_PRINTER_ID] = LabelPrinterManager()
+    managers.update({serial: LabelPrinterManager(serial) for serial in serials})
+    print(f"Managing label printers: {list(managers)}")
+    return managers
+
 class LabelPrinterManager:
-    def __init__(self):
-        self.printer = Usb(idVendor=MAKE, idProduct=MODEL, usb_args={}, timeout=TIMEOUT, profile=PROFILE)
+    def __init__(self, serial=None, address=None):
+        self.printer_id = address or serial or DEFAULT_PRINTER_ID
+        if address:
+            self.printer = PersistentNetwork(address, profile=PROFILE)
+        else:
+            usb_args = {"serial_number": serial} if serial else {}
+            self.printer = PersistentUsb(idVendor=MAKE, idProduct=MODEL, usb_args=usb_args, timeout=TIMEOUT, profile=PROFILE)
         self.cooldown = PRINT_COOLDOWN
         self.last_request_time = 0
         self.lock = threading.Lock()
+        self.process_counter = 0
         self.last_status = None
+        self.last_reason = None
+        self.asb_enabled = False
+        self.asb_session_id = None
+        self.last_asb_attempt = 0
+        self.user_settings = UserSettingsStore(settings_store_path(address or serial))
+        self.raster_cache = {}
+        self.smiley_strip_cache = None
+        self.nv_asset_store = NVAssetStore(asset_store_path(address or serial))
+        self.nv_keys = set()
+        self.last_nv_sync_attempt = 0
+        if NV_GRAPHICS_MODE:
+            self.sync_nv_assets()
         self.get_status()
+        threading.Thread(target=self.asb_listener, daemon=True).start()
+        self.printer.watch_hotplug(self.printer_changed)
+
+    def printer_changed(self, attached):
+        # Verified settings are kept: they live in the printer's NVRAM and are stored with the unit's identity,
+        # so a different unit on the same port gets configured
+        # The attached unit may not hold our NV graphics, so the next sync re-reads its key list
+        self.nv_keys = set()
+        self.last_nv_sync_attempt = 0
+        # A replugged printer comes back with ASB off, so the next status check polls and re-enables it
+        self.asb_enabled = False
+        self.last_asb_attempt = 0
 
     def configure_printer(self, buzzer=False, paper_removal_standby=False):
         print("Configuring printer")
-        try:
+        settings = {
+            BUZZER_SETTING: BUZZER_INTERNAL if buzzer else BUZZER_OFF,
+            PAPER_REMOVAL_STANDBY_SETTING: PAPER_REMOVAL_STANDBY_ON if paper_removal_standby else PAPER_REMOVAL_STANDBY_OFF,
+            PRINT_SPEED_SETTING: PRINT_SPEED
+        }
+        with self.lock:
+            try:
+                self.printer.open()
+                printer = self.printer.identity()
+                if settings == self.user_settings.get(printer):
+                    print("Printer settings unchanged, skipping configuration")
+                    return True
+                changed, verified = apply_settings(self.printer, settings)
+                # Leaving user setting mode resets the printer, so start a fresh session
+                self.printer.disconnect()
+                ready = self.wait_for_printer()
+                self.asb_enabled = False
+                self.last_asb_attempt = 0
+                print(f"Configuration {'verified' if verified else 'not verified'}, changed: {changed}, ready: {ready}")
+                if verified and printer:
+                    self.user_settings.set(printer, settings)
+                return verified and ready
+            except Exception as e:
+                print(f"Configuration error: {str(e)}")
+                return False
+
+    def wait_for_printer(self):
+        deadline = time.time() + CONFIGURATION_SLEEP_TIME
+        while time.time() < deadline:
+            try:
+                if int.from_bytes(self.printer.query(TRANSMIT_PRINTER_STATUS), byteorder='big') in VALID_PRINTER_STATUSES:
+                    return True
+            except (DeviceNotFoundError, OSError):
+                pass
+            time.sleep(CONFIGURATION_POLL_INTERVAL_S)
+        print(f"Printer not ready {CONFIGURATION_SLEEP_TIME} seconds after configuration")
+        return False
 
-            gs = b'\x1D' # prefix for GS commands
-            e_command = b'\x28\x45'  # prefix for GS ( E commands
-
-            # Function 1 - Open User Setting Mode 
-            pL = b'\x03' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x01' # function code 1
-            d1 = b'\x49' # data 1: character "I"
-            d2 = b'\x4E' # data 2: character "N"
-            print(f"Sending 'Open User Setting' command: {gs + e_command + pL + pH + fn + d1 + d2}")
-            self.printer._raw(gs + e_command + pL + pH + fn + d1 + d2)
-            self.clear_label_data_buffer()
-
-            # Function 5 - 119: Set Buzzer Mode
-            pL = b'\x04' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x05' # function code 5
-            a = b'\x77' # buzzer setting (119)
-            nL = b'\x00' # 0 for off, 1 for external, 2 for internal
-            if buzzer:
-                nL = b'\x02'
-            nH = b'\x00' # high bit (unused)
-            print(f"Sending 'Set Buzzer Mode' command: {gs + e_command + pL + pH + fn + a + nL + nH}")
-            self.printer._raw(gs + e_command + pL + pH + fn + a + nL + nH)
-            self.clear_label_data_buffer()
-
-            # Function 5 - 14: Turn off paper removal standby
-            pL = b'\x04' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x05' # function code 5
-            a = b'\x0E' # paper removal standby setting (14)
-            nL = b'\x00' # 0 (x00) for off, 64 (x40) for on
-            if paper_removal_standby:
-                nL = b'\x40'
-            nH = b'\x00' # high bit (unused)
-            print(f"Sending 'Turn off paper removal standby' command: {gs + e_command + pL + pH + fn + a + nL + nH}")
-            self.printer._raw(gs + e_command + pL + pH + fn + a + nL + nH)
-            self.clear_label_data_buffer()
-
-            # Function 5 - 6: Set print speed
-            pL = b'\x04' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x05' # function code 5
-            a = b'\x06' # print speed setting (6)
-            nL = b'\x02' # 1 (slow) - 11 (fast). Need to go slow when using high-tack paper. 
-            nH = b'\x00' # high bit (unused)
-            print(f"Sending 'Set print speed' command: {gs + e_command + pL + pH + fn + a + nL + nH}")
-            self.printer._raw(gs + e_command + pL + pH + fn + a + nL + nH)
-            self.clear_label_data_buffer()
-
-
-            # Function 2 - Close User Setting Mode 
-            pL = b'\x04' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x02' # function code 2
-            d1 = b'\x4F' # data 1: character "O"
-            d2 = b'\x55' # data 2: character "U"
-            d3 = b'\x54' # data 3: character "T"
-            print(f"Sending 'Close User Setting' command: {gs + e_command + pL + pH + fn + d1 + d2 + d3}")
-            self.printer._raw(gs + e_command + pL + pH + fn + d1 + d2 + d3)
-            self.clear_label_data_buffer()
-
-            self.printer.close()
-
-            for i in range(CONFIGURATION_SLEEP_TIME):
-                print(f"Waiting... {i+1}/{CONFIGURATION_SLEEP_TIME} seconds")
-                time.sleep(1)
-            
-            return True
-        except Exception as e:
-            print(f"Configuration error: {str(e)}")
-            return False
-        
     def get_printer_status(self):
         print(f"Getting printer status")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_PRINTER_STATUS)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        printer_status_raw = self.printer._read()
-        self.printer.close()
+        printer_status_raw = self.printer.query(TRANSMIT_PRINTER_STATUS)
 
         #print(f"Printer status raw: {printer_status_raw}")
         printer_status_int = int.from_bytes(printer_status_raw, byteorder='big')
@@ -179,11 +241,7 @@ class LabelPrinterManager:
     
     def get_offline_cause(self):
         print(f"Getting offline cause")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_OFFLINE_CAUSE)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        offline_cause_raw = self.printer._read()
-        self.printer.close()
+        offline_cause_raw = self.printer.query(TRANSMIT_OFFLINE_CAUSE)
 
         print(f"Offline cause raw: {offline_cause_raw}")
         offline_cause_int = int.from_bytes(offline_cause_raw, byteorder='big')
@@ -213,11 +271,7 @@ class LabelPrinterManager:
     
     def get_error_cause(self):
         print(f"Getting error cause")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_ERROR_CAUSE)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        error_cause_raw = self.printer._read()
-        self.printer.close()
+        error_cause_raw = self.printer.query(TRANSMIT_ERROR_CAUSE)
 
         print(f"Error cause raw: {error_cause_raw}")
         error_cause_int = int.from_bytes(error_cause_raw, byteorder='big')
@@ -247,11 +301,7 @@ class LabelPrinterManager:
 
     def get_paper_status(self):
         print(f"Getting paper status")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_PAPER_STATUS)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        paper_status_raw = self.printer._read()
-        self.printer.close()
+        paper_status_raw = self.printer.query(TRANSMIT_PAPER_STATUS)
 
         #print(f"Paper status raw: {paper_status_raw}")
         paper_status_int = int.from_bytes(paper_status_raw, byteorder='big')
@@ -268,6 +318,125 @@ class LabelPrinterManager:
         }
 
     def get_status(self):
+        if self.asb_enabled:
+            return {
+                "status": self.last_status,
+                "reason": self.last_reason
+            }
+        status = self.poll_status()
+        if ASB_MODE and status["status"] != "not_found" and time.time() - self.last_asb_attempt > ASB_RETRY_INTERVAL_S:
+            if self.enable_asb():
+                return {
+                    "status": self.last_status,
+                    "reason": self.last_reason
+                }
+        return status
+
+    def apply_asb_packets(self, data):
+        packets = find_asb_packets(data)
+        if not packets:
+            return False
+        asb = decode_asb(packets[-1])
+        status, reason = status_from_asb(asb, report_paper_low=False)
+        if status != self.last_status:
+            print(f"ASB status changed: {status} ({reason}), {asb}")
+        self.last_status = status
+        self.last_reason = reason
+        return True
+
+    def enable_asb(self):
+        print("Enabling Automatic Status Back")
+        self.last_asb_attempt = time.time()
+        with self.lock:
+            try:
+                self.printer.open()
+                self.printer._raw(enable_asb_command())
+                # The printer answers GS a with the current status
+                if self.apply_asb_packets(self.printer.read_available(ASB_FIRST_PACKET_TIMEOUT_MS)):
+                    self.asb_enabled = True
+                    self.asb_session_id = self.printer.session_id
+                else:
+                    print("No ASB packet received, continuing with status polling")
+            except Exception as e:
+                print(f"Enable ASB error: {str(e)}")
+            finally:
+                self.printer.close()
+        return self.asb_enabled
+
+    def read_asb_status(self):
+        with self.lock:
+            try:
+                self.printer.open()
+                if self.printer.session_id != self.asb_session_id:
+                    # New USB handle since ASB was enabled; fall back to polling until it is re-enabled
+                    print("Printer reconnected, re-enabling ASB")
+                    self.asb_enabled = False
+                    self.last_asb_attempt = 0
+                    return
+                self.apply_asb_packets(self.printer.read_available(ASB_READ_TIMEOUT_MS))
+            except DeviceNotFoundError as e:
+                print(f"Printer not found: {str(e)}")
+                self.asb_enabled = False
+                self.last_status = "not_found"
+                self.last_reason = str(e)
+            except Exception as e:
+                print(f"ASB read error: {str(e)}")
+                # Re-enable on the next status check to get a fresh status packet
+                self.asb_enabled = False
+                self.last_asb_attempt = 0
+                self.last_status = "unknown"
+                self.last_reason = f"exception: {str(e)}"
+            finally:
+                self.printer.close()
+
+    def asb_listener(self):
+        while True:
+            time.sleep(ASB_READ_INTERVAL_S)
+            # Packets stay buffered in the printer while a job holds the device
+            if self.lock.locked():
+                continue
+            if self.asb_enabled:
+                self.read_asb_status()
+            # Retried with ASB off too, e.g. after a failed sync or a replug
+            if self.nv_sync_due():
+                self.sync_nv_assets()
+
+    def nv_sync_due(self):
+        return (NV_GRAPHICS_MODE
+                and self.nv_keys != set(NV_ASSETS)
+                and self.last_status == "ready"
+                and time.time() - self.last_nv_sync_attempt > NV_SYNC_RETRY_INTERVAL_S)
+
+    def write_buffer(self, data, timeout_ms=WRITE_TIMEOUT_MS):
+        for i in range(0, len(data), WRITE_CHUNK_SIZE):
+            self.printer.write_bytes(data[i:i + WRITE_CHUNK_SIZE], timeout_ms)
+
+    def sync_nv_assets(self):
+        # NV memory has limited write endurance, so only upload images whose hash
+        # changed or that are missing from the printer
+        self.last_nv_sync_attempt = time.time()
+        synced = set()
+        with self.lock:
+            try:
+                self.printer.open()
+                printer_keys = read_key_codes(self.printer, NV_KEY_CODES_TIMEOUT_MS)
+                for key, path in NV_ASSETS.items():
+                    file_hash = hash_file(path)
+                    on_printer = printer_keys is None or key in printer_keys
+                    if not on_printer or self.nv_asset_store.get_hash(key) != file_hash:
+                        print(f"Uploading {path} to NV graphics memory as {key.decode()}")
+                        self.write_buffer(define_nv_graphic_command(key, path), NV_DEFINE_TIMEOUT_MS)
+                        self.nv_asset_store.set_hash(key, file_hash)
+                    synced.add(key)
+            except Exception as e:
+                print(f"NV asset sync error: {str(e)}")
+            finally:
+                self.printer.close()
+        self.nv_keys = synced
+        print(f"NV graphics synced: {sorted(key.decode() for key in synced)}")
+        return synced == set(NV_ASSETS)
+
+    def poll_status(self):
         with self.lock:
             self.throttle(printing=False)
             status = "unknown"
@@ -326,6 +495,7 @@ class LabelPrinterManager:
                 reason = f"exception: {str(e)}"
             finally:
                 self.last_status = status
+                self.last_reason = reason
                 self.printer.close()
             return {
                 "status": status,
@@ -354,54 +524,84 @@ class LabelPrinterManager:
                 return False
             try:
                 self.start_print_job()
-                self.print_logo()
-
-                if(order):
-                    self.print_heading(order)
-
-                if(item):
-                    try:
-                        if(int(item_total) > 1 and int(item_number) > 0):
-                            self.print_details(item, item_number, item_total)
-                        else:
-                            self.print_details(item)
-                    except ValueError:
-                        self.print_details(item)
-                        print(f"Invalid item_total value: {item_total}")
-                    finally:
-                        self.print_gap()
-                else:
-                    self.print_gap()
-
-                if(upcs):
-                    try:
-                        upcs = json.loads(upcs)
-                    except json.JSONDecodeError:
-                        print(f"Error: Invalid UPC format. Received: {upcs}")
-                        upcs = []
-
-                #if fulfillment and ((item and (len(upcs) <= 1 or paid)) or (not item)):
-                    #self.print_qr(fulfillment, item)
-                
-                if paid:
-                    self.print_paid()
-                else:
-                    for i in range(len(upcs)):
-                        self.print_barcode(upcs[i])
-                        if i < len(upcs) - 1:
-                            self.print_gap()
-                            
-                self.print_smileys()
-                
+                self.print_label_body(order, item, upcs, item_number, item_total, paid)
                 self.end_print_job()
                 
                 return True
             
             except Exception as e:
                 print(f"Print error: {str(e)}")
-                self.end_print_job()
+                self.end_print_job(wait=False)
                 return False
-            
+
+    def print_label_batch(self, order, items):
+        print(f"Printing {len(items)} labels for order: {order}")
+        with self.lock:
+            self.throttle()
+            if self.last_status != "ready":
+                print(f"Printer not ready: {self.last_status}")
+                self.printer.close()
+                return [False] * len(items)
+            results = []
+            try:
+                self.start_print_job()
+                for label in items:
+                    try:
+                        self.print_label_body(order, label.get('item', ''), label.get('upcs', []), label.get('item_number', ''), label.get('item_total', ''), label.get('paid') in (True, 'true'))
+                        self.feed_to_cut_position()
+                        self.printer.cut()
+                        results.append(True)
+                    except Exception as e:
+                        print(f"Print error: {str(e)}")
+                        results.append(False)
+                self.wait_for_completion()
+            except Exception as e:
+                print(f"Batch print error: {str(e)}")
+                results += [False] * (len(items) - len(results))
+            finally:
+                self.printer.close()
+            return results
+
+    def print_label_body(self, order, item, upcs, item_number, item_total, paid):
+        self.print_logo()
+
+        if(order):
+            self.print_heading(order)
+
+        if(item):
+            try:
+                if(int(item_total) > 1 and int(item_number) > 0):
+                    self.print_details(item, item_number, item_total)
+                else:
+                    self.print_details(item)
+            except ValueError:
+                self.print_details(item)
+                print(f"Invalid item_total value: {item_total}")
+            finally:
+                self.print_gap()
+        else:
+            self.print_gap()
+
+        if(upcs) and isinstance(upcs, str):
+            try:
+                upcs = json.loads(upcs)
+            except json.JSONDecodeError:
+                print(f"Error: Invalid UPC format. Received: {upcs}")
+                upcs = []
+
+        #if fulfillment and ((item and (len(upcs) <= 1 or paid)) or (not item)):
+            #self.print_qr(fulfillment, item)
+        
+        if paid:
+            self.print_paid()
+        else:
+            for i in range(len(upcs)):
+                self.print_barcode(upcs[i])
+                if i < len(upcs) - 1:
+                    self.print_gap()
+                    
+        self.print_smileys()
+
     def print_text(self, text):
         print(f"Printing text: {text}")
         with self.lock:
@@ -415,6 +615,7 @@ class LabelPrinterManager:
                 self.printer.ln(2)
                 self.printer.set(align='center', normal_textsize=True)
                 self.printer.cut()
+                self.wait_for_completion()
                 self.printer.close()
 
                 return True
@@ -424,14 +625,29 @@ class LabelPrinterManager:
             
     def print_inventory_label(self, item, print_date=False, print_time=False, quantity=2):
         print(f"Printing inventory label: {item} {print_date} {print_time} {quantity}")
-        
+        try:
+            quantity = int(quantity)
+        except ValueError:
+            print(f"Invalid quantity: {quantity}")
+            return False
+        return self.print_inventory_batch([{"item": item, "quantity": quantity}], print_date, print_time)
+
+    def print_inventory_batch(self, items, print_date=False, print_time=False):
+        print(f"Printing inventory batch: {items} {print_date} {print_time}")
+
         with self.lock:
             try:
-                quantity = int(quantity)
-                if quantity < 1 or quantity > 4:
-                    print(f"Invalid quantity: {quantity}")
+                labels = []
+                for entry in items:
+                    quantity = int(entry.get("quantity", 2))
+                    if quantity < 1 or quantity > INVENTORY_MAX_QUANTITY:
+                        print(f"Invalid quantity: {quantity}")
+                        return False
+                    labels += [entry.get("item", "")] * quantity
+                if not labels or len(labels) > INVENTORY_BATCH_MAX_LABELS:
+                    print(f"Invalid batch size: {len(labels)}")
                     return False
-                
+
                 if isinstance(print_date, str):
                     print_date = print_date.lower() in ('true', '1', 'yes', 'on')
                 if isinstance(print_time, str):
@@ -442,31 +658,32 @@ class LabelPrinterManager:
                 date_str = now_et.strftime("%m/%d/%Y")
                 time_str = now_et.strftime("%H:%M")
 
-                for i in range(quantity):
-                    self.throttle()
-                    self.printer.open()
+                # One device session and one cooldown for the whole batch
+                self.throttle()
+                self.printer.open()
+                for item in labels:
                     self.printer.ln(1)
                     self.print_logo()
                     self.printer.ln(1)
-                    self.clear_label_data_buffer()
                     self.printer.set(align='center', normal_textsize=True)
                     if print_date:
-                        print(f"Printing date: {date_str}")
                         self.printer.text(format_string(date_str, True))
                         self.printer.ln(1)
                     if print_time:
-                        print(f"Printing time: {time_str}")
                         self.printer.text(format_string(time_str, True))
                         self.printer.ln(1)
                     self.printer.set(align='center', double_height=True, double_width=True, bold=True, density=3)
                     self.printer.text(format_string(item, True))
-                    self.printer.ln(3)
+                    self.printer.ln(1)
+                    self.feed_to_cut_position()
                     self.printer.cut()
-                    self.printer.close()
+                self.wait_for_completion()
+                self.printer.close()
                 
                 return True
             except Exception as e:
                 print(f"Print inventory label error: {str(e)}")
+                self.printer.close()
                 return False
                 
             
@@ -476,11 +693,37 @@ class LabelPrinterManager:
         self.printer.set(align='center', normal_textsize=True, flip=False)
         print(f"Printing")
 
-    def end_print_job(self):
+    def end_print_job(self, wait=True):
         self.feed_to_cut_position()
         self.printer.cut()
+        if wait:
+            self.wait_for_completion()
         self.printer.close()
 
+    def wait_for_completion(self):
+        # GS ( H is answered only once all preceding data has been printed, so the next
+        # job can start as soon as the mechanism is free instead of after PRINT_COOLDOWN
+        self.process_counter += 1
+        process_id = process_id_for(self.process_counter)
+        response = process_response(process_id)
+        self.printer._raw(process_id_command(process_id))
+        start_time = time.time()
+        data = b''
+        while time.time() - start_time < COMPLETION_TIMEOUT_S:
+            try:
+                data += self.printer.read_bytes(COMPLETION_READ_TIMEOUT_MS)
+            except OSError as e:
+                print(f"Completion read error: {str(e)}")
+                return False
+            if response in data:
+                # Status changes during the job arrive as ASB packets on the same endpoint
+                self.apply_asb_packets(data.replace(response, b''))
+                self.cooldown = 0
+                print(f"Print completed in {time.time() - start_time:.2f} seconds")
+                return True
+        print(f"No completion response after {COMPLETION_TIMEOUT_S} seconds, falling back to print cooldown")
+        return False
+
     def feed_to_cut_position(self):
         fs = b'\x1C' # prefix for FS commands
         l_command = b'\x28\x4C' # prefix for FS ( L commands
@@ -493,44 +736,58 @@ class LabelPrinterManager:
         print(f"Sending 'feed to cut position' command: {fs + l_command + pL + pH + fn + m}")
         self.printer._raw(fs + l_command + pL + pH + fn + m)
 
+    def get_image_raster(self, path):
+        # Rasterizing a PNG is slow on the Pi, so keep the ESC/POS bytes until the file changes
+        mtime = os.path.getmtime(path)
+        cached = self.raster_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            print(f"Rasterizing {path}")
+            renderer = Dummy(profile=PROFILE)
+            renderer.image(path, **IMAGE_SETTINGS)
+            cached = (mtime, renderer.output)
+            self.raster_cache[path] = cached
+        return cached[1]
+
+    def print_image(self, key, path):
+        if key in self.nv_keys:
+            self.printer._raw(print_nv_graphic_command(key))
+            return
+        self.write_buffer(self.get_image_raster(path))
+
     def print_logo(self):
-        self.printer.image(LOGO_PATH,
-                           high_density_vertical=True, 
-                           high_density_horizontal=True, 
-                           impl='bitImageRaster', 
-                           fragment_height=LOGO_FRAGMENT_HEIGHT, 
-                           center=False)
+        self.print_image(NV_LOGO_KEY, LOGO_PATH)
         self.clear_label_data_buffer()
 
+    def get_smiley_strip_raster(self):
+        # All four smileys go out as one image, composited once and rebuilt only when a source PNG changes
+        mtimes = tuple(os.path.getmtime(path) for path in SMILEY_STRIP_PATHS)
+        if self.smiley_strip_cache is None or self.smiley_strip_cache[0] != mtimes:
+            print("Compositing smiley strip")
+            smileys = [Image.open(path).convert("RGBA") for path in SMILEY_STRIP_PATHS]
+            width = max(smiley.width for smiley in smileys)
+            height = sum(smiley.height for smiley in smileys) + SMILEY_STRIP_GAP_DOTS * (len(smileys) - 1)
+            strip = Image.new("RGB", (width, height), (255, 255, 255))
+            y = 0
+            for smiley in smileys:
+                strip.paste(smiley, ((width - smiley.width) // 2, y), smiley)
+                y += smiley.height + SMILEY_STRIP_GAP_DOTS
+            renderer = Dummy(profile=PROFILE)
+            renderer.image(strip, **IMAGE_SETTINGS)
+            self.smiley_strip_cache = (mtimes, renderer.output)
+        return self.smiley_strip_cache[1]
+
     def print_smileys(self):
         self.printer.ln(2)
-        self.printer.image(SMILEY_1_PATH,
-                           high_density_vertical=True, 
-                           high_density_horizontal=True, 
-                           impl='bitImageRaster', 
-                           fragment_height=LOGO_FRAGMENT_HEIGHT, 
-                           center=False)
-        self.printer.ln(2)
-        self.printer.image(SMILEY_2_PATH,
-                           high_density_vertical=True, 
-                           high_density_horizontal=True, 
-                           impl='bitImageRaster', 
-                           fragment_height=LOGO_FRAGMENT_HEIGHT, 
-                           center=False)
-        self.printer.ln(2)
-        self.printer.image(SMILEY_1_PATH,
-                           high_density_vertical=True, 
-                           high_density_horizontal=True, 
-                           impl='bitImageRaster', 
-                           fragment_height=LOGO_FRAGMENT_HEIGHT, 
-                           center=False)
-        self.printer.ln(2)
-        self.printer.image(SMILEY_2_PATH,
-                           high_density_vertical=True, 
-                           high_density_horizontal=True, 
-                           impl='bitImageRaster', 
-                           fragment_height=LOGO_FRAGMENT_HEIGHT, 
-                           center=False)
+        if NV_SMILEY_1_KEY in self.nv_keys and NV_SMILEY_2_KEY in self.nv_keys:
+            self.printer._raw(print_nv_graphic_command(NV_SMILEY_1_KEY))
+            self.printer.ln(2)
+            self.printer._raw(print_nv_graphic_command(NV_SMILEY_2_KEY))
+            self.printer.ln(2)
+            self.printer._raw(print_nv_graphic_command(NV_SMILEY_1_KEY))
+            self.printer.ln(2)
+            self.printer._raw(print_nv_graphic_command(NV_SMILEY_2_KEY))
+        else:
+            self.write_buffer(self.get_smiley_strip_raster())
         self.clear_label_data_buffer()
 
     def print_heading(self, order):
@@ -593,6 +850,7 @@ class LabelPrinterManager:
                 self.printer.text("RELOADING PAPER")
                 self.printer.ln(12)
                 self.printer.cut()
+                self.wait_for_completion()
                 self.printer.close()
             except Exception as e:
                 print(f"Reload paper error: {str(e)}")
@@ -0,0 +1,99 @@
+# Persistent printer connection shared by everything in the service that talks to the printer.
+# Mixed into an escpos printer class; subclasses provide connect, release, send and receive.
+import threading
+import time
+
+READ_SIZE = 64
+QUERY_TIMEOUT_MS = 1000
+
+class PersistentTransport:
+    # Exceptions that mean "no data yet" rather than a broken connection
+    timeout_errors = ()
+
+    def init_session(self):
+        self.connected = False
+        # Bumped on every new connection; per-session printer state like ASB must be set up again
+        self.session_id = 0
+        self.session_lock = threading.RLock()
+
+    def open(self):
+        # Connecting is slow, so the connection is kept for the life of the process
+        with self.session_lock:
+            if self.connected:
+                return
+            self.connect()
+            self.connected = True
+            self.session_id += 1
+
+    def close(self):
+        # Jobs still call close() when they finish; the connection is only released by disconnect()
+        pass
+
+    def disconnect(self):
+        with self.session_lock:
+            self.connected = False
+            try:
+                self.release()
+            except OSError as e:
+                print(f"Printer release error: {str(e)}")
+
+    def reconnect(self):
+        print("Reconnecting to printer")
+        self.disconnect()
+        self.open()
+
+    def with_reconnect(self, operation):
+        self.open()
+        try:
+            return operation()
+        except self.timeout_errors:
+            raise
+        except OSError as e:
+            # Stale connection after a printer reset, replug or network drop; one retry on a fresh one
+            print(f"Printer connection error: {str(e)}")
+            self.reconnect()
+            return operation()
+
+    def _raw(self, msg):
+        self.with_reconnect(lambda: self.send(msg))
+
+    def write_bytes(self, data, timeout_ms):
+        self.with_reconnect(lambda: self.send(data, timeout_ms))
+
+    def read_bytes(self, timeout_ms, size=READ_SIZE):
+        # b'' if nothing arrived within timeout_ms
+        return self.with_reconnect(lambda: self.receive(size, timeout_ms))
+
+    def read_available(self, timeout_ms):
+        # Drain everything the printer has sent until it has been quiet for timeout_ms
+        data = b''
+        while True:
+            chunk = self.read_bytes(timeout_ms)
+            if not chunk:
+                return data
+            data += chunk
+
+    def query(self, command, timeout_ms=QUERY_TIMEOUT_MS):
+        # Returns as soon as the response arrives instead of sleeping a fixed delay,
+        # or b'' if nothing arrives before the deadline
+        with self.session_lock:
+            # Retried as a whole, since a command sent on a dead connection never gets an answer
+            return self.with_reconnect(lambda: self.exchange(command, timeout_ms))
+
+    def exchange(self, command, timeout_ms):
+        self.send(command)
+        deadline = time.time() + timeout_ms / 1000
+        while True:
+            remaining_ms = int((deadline - time.time()) * 1000)
+            if remaining_ms <= 0:
+                return b''
+            data = self.receive(READ_SIZE, remaining_ms)
+            if data:
+                return data
+
+    def identity(self):
+        # The connected unit, or None if it can't be told apart from a replacement
+        return None
+
+    def watch_hotplug(self, on_change=None):
+        pass
@@ -0,0 +1,116 @@
+# Customized setting values (GS ( E user setting mode) for Epson printers
+import os
+import json
+
+GS = b'\x1D'
+USER_SETTING_COMMAND = GS + b'\x28\x45'  # GS ( E
+FN_OPEN = b'\x01'
+FN_CLOSE = b'\x02'
+FN_SET_VALUE = b'\x05'
+FN_GET_VALUE = b'\x06'
+SETTING_RESPONSE_HEADER = b'\x37\x27'
+SETTING_SEPARATOR = b'\x1F'
+
+OPEN_RESPONSE_TIMEOUT_MS = 500
+SETTING_RESPONSE_TIMEOUT_MS = 500
+
+USER_SETTINGS_STORE_PATH = os.environ.get('USER_SETTINGS_STORE_PATH', '/data/user_settings.json')
+
+def settings_store_path(printer_id=None):
+    # Settings live in each printer's NVRAM, so each printer keeps its own record
+    if not printer_id:
+        return USER_SETTINGS_STORE_PATH
+    root, ext = os.path.splitext(USER_SETTINGS_STORE_PATH)
+    return f"{root}-{printer_id}{ext}"
+
+def user_setting_command(fn, data):
+    payload = fn + data
+    return USER_SETTING_COMMAND + len(payload).to_bytes(2, 'little') + payload
+
+def open_user_setting_command():
+    return user_setting_command(FN_OPEN, b'IN')
+
+def close_user_setting_command():
+    # Ending user setting mode makes the printer perform a software reset
+    return user_setting_command(FN_CLOSE, b'OUT')
+
+def set_setting_command(setting, value):
+    return user_setting_command(FN_SET_VALUE, bytes([setting]) + value.to_bytes(2, 'little'))
+
+def get_setting_command(setting):
+    return user_setting_command(FN_GET_VALUE, bytes([setting]))
+
+def parse_setting_response(response):
+    # 37 27, setting number and value as ASCII decimal separated by 1F, NUL
+    start = response.find(SETTING_RESPONSE_HEADER)
+    if start == -1:
+        return None
+    data = response[start + len(SETTING_RESPONSE_HEADER):]
+    end = data.find(b'\x00')
+    if end == -1:
+        return None
+    try:
+        return int(data[:end].split(SETTING_SEPARATOR)[-1])
+    except ValueError:
+        return None
+
+def read_settings(printer, settings):
+    return {setting: parse_setting_response(printer.query(get_setting_command(setting), SETTING_RESPONSE_TIMEOUT_MS))
+            for setting in settings}
+
+def apply_settings(printer, settings):
+    # Only writes values that differ from what the printer reports, then reads them back.
+    # Returns (changed settings, whether the printer now reports the requested values)
+    printer._raw(open_user_setting_command())
+    printer.read_available(OPEN_RESPONSE_TIMEOUT_MS)
+    try:
+        current = read_settings(printer, settings)
+        print(f"Current printer settings: {current}")
+        changed = {setting: value for setting, value in settings.items() if current[setting] != value}
+        for setting, value in changed.items():
+            print(f"Setting {setting} from {current[setting]} to {value}")
+            printer._raw(set_setting_command(setting, value))
+        verified = read_settings(printer, settings) == settings if changed else True
+    finally:
+        try:
+            printer._raw(close_user_setting_command())
+        except OSError as e:
+            print(f"Close user setting mode error: {str(e)}")
+    return changed, verified
+
+class UserSettingsStore:
+    # Remembers the last verified settings and the unit they were verified on, so a
+    # matching push after a restart doesn't enter user setting mode, which always resets the printer
+    def __init__(self, path=USER_SETTINGS_STORE_PATH):
+        self.path = path
+        self.printer = None
+        self.settings = None
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+            self.printer = stored['printer']
+            self.settings = {int(setting): value for setting, value in stored['settings'].items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Failed to load user settings store: {e}")
+
+    def get(self, printer):
+        # Nothing is known about a unit we can't identify, or about a different unit
+        if not printer or printer != self.printer:
+            return None
+        return self.settings
+
+    def set(self, printer, settings):
+        self.printer = printer
+        self.settings = dict(settings)
+        try:
+            store_dir = os.path.dirname(self.path)
+            if store_dir:
+                os.makedirs(store_dir, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"printer": printer, "settings": self.settings}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to save user settings store: {e}")
@@ -1,5 +1,6 @@
 from flask import Flask, jsonify, request
-from receipt_printer_manager import ReceiptPrinterManager
+from receipt_printer_manager import create_receipt_printer_managers
+from device_pool import DevicePool
 import threading
 import requests
 import time
@@ -7,12 +8,20 @@ import time
 RECEIPT_DEBUG_MODE = False
 
 app = Flask(__name__)
-receipt_printer_manager = ReceiptPrinterManager()
+receipt_printers = DevicePool(create_receipt_printer_managers())
+
+def unknown_printer():
+    return jsonify({"success": False, "message": "Unknown printer"}), 404
+
+def result(manager, success, **kwargs):
+    # Island routes the next job and fails over based on the printer and its status
+    return jsonify(dict({"success": success, "printer": manager.printer_id, "status": manager.last_status}, **kwargs))
 
 @app.route('/status')
 def get_receipt_printer_status():
     try:
-        return jsonify(receipt_printer_manager.get_status())
+        max_age = request.args.get('max_age', None, type=float)
+        return jsonify(receipt_printers.get_status(max_age=max_age))
     except Exception as e:
         return jsonify({"status": "unknown", "reason": f"exception: {str(e)}"})
 
@@ -20,7 +29,10 @@ def get_receipt_printer_status():
 def configure_receipt_printer():
     fast = request.args.get('fast', 'false') == 'true'
     high_density = request.args.get('high_density', 'true') == 'true'
-    success = receipt_printer_manager.configure_printer(fast, high_density)
+    managers = receipt_printers.select(request.args.get('printer'))
+    if not managers:
+        return unknown_printer()
+    success = all([manager.configure_printer(fast, high_density) for manager in managers])
     return jsonify({"success": success})
 
 @app.route('/print')
@@ -31,13 +43,27 @@ def print_receipt():
     details = request.args.get('details', '')
     wait = request.args.get('wait', None)
 
-    success = receipt_printer_manager.print_receipt(order, upcs, details, message, wait)
+    manager = receipt_printers.get(request.args.get('printer'))
+    if not manager:
+        return unknown_printer()
+    success = manager.print_receipt(order, upcs, details, message, wait)
+    return result(manager, success)
+
+@app.route('/assets/sync')
+def sync_receipt_assets():
+    managers = receipt_printers.select(request.args.get('printer'))
+    if not managers:
+        return unknown_printer()
+    success = all([manager.sync_nv_assets() for manager in managers])
     return jsonify({"success": success})
 
 @app.route('/reload')
 def reload_receipt_paper():
-    success = receipt_printer_manager.reload_paper()
-    return jsonify({"success": success})
+    manager = receipt_printers.get(request.args.get('printer'))
+    if not manager:
+        return unknown_printer()
+    success = manager.reload_paper()
+    return result(manager, success)
 
 def send_receipt_debug_request():
     time.sleep(5)
@@ -0,0 +1,34 @@
+# Several printers of the same kind attached to one service
+STATUS_PREFERENCE = ["ready", "low_paper"]
+
+class DevicePool:
+    def __init__(self, managers):
+        self.managers = managers
+
+    def get(self, printer_id=None):
+        if printer_id:
+            return self.managers.get(printer_id)
+        # Callers that don't pick a printer get the best one by last known status
+        for status in STATUS_PREFERENCE:
+            for manager in self.managers.values():
+                if manager.last_status == status:
+                    return manager
+        return next(iter(self.managers.values()))
+
+    def select(self, printer_id=None):
+        # Maintenance like configuration applies to every printer unless one is named
+        if printer_id:
+            return [self.managers[printer_id]] if printer_id in self.managers else []
+        return list(self.managers.values())
+
+    def get_status(self, **kwargs):
+        printers = {}
+        for printer_id, manager in self.managers.items():
+            try:
+                printers[printer_id] = manager.get_status(**kwargs)
+            except Exception as e:
+                printers[printer_id] = {"status": "unknown", "reason": f"exception: {str(e)}"}
+        # The top-level status is the best printer's, so single-printer callers keep working
+        best = next((status for preferred in STATUS_PREFERENCE for status in printers.values() if status["status"] == preferred),
+                    next(iter(printers.values())))
+        return dict(best, printers=printers)
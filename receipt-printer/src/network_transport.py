@@ -0,0 +1,53 @@
+# Persistent raw TCP (port 9100) connection to Epson printers
+import socket
+from escpos.printer import Network
+from escpos.exceptions import DeviceNotFoundError
+from transport import PersistentTransport
+
+DEFAULT_PORT = 9100
+CONNECT_TIMEOUT_S = 5
+WRITE_TIMEOUT_S = 30
+
+def parse_address(address):
+    host, _, port = address.partition(":")
+    return host, int(port) if port else DEFAULT_PORT
+
+class PersistentNetwork(PersistentTransport, Network):
+    timeout_errors = (socket.timeout,)
+
+    def __init__(self, address, *args, **kwargs):
+        host, port = parse_address(address)
+        self.init_session()
+        super().__init__(host, port, WRITE_TIMEOUT_S, *args, **kwargs)
+
+    def connect(self):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT_S)
+        except OSError as e:
+            raise DeviceNotFoundError(f"Could not connect to printer at {self.host}:{self.port}: {str(e)}")
+        # Status queries are a few bytes each; don't let Nagle hold them back
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.device = sock
+
+    def release(self):
+        if self.device:
+            self.device.close()
+        self.device = None
+
+    def identity(self):
+        return f"{self.host}:{self.port}"
+
+    def send(self, data, timeout_ms=None):
+        self.device.settimeout(WRITE_TIMEOUT_S if timeout_ms is None else timeout_ms / 1000)
+        self.device.sendall(data)
+
+    def receive(self, size, timeout_ms):
+        self.device.settimeout(timeout_ms / 1000)
+        try:
+            data = self.device.recv(size)
+        except socket.timeout:
+            return b''
+        if not data:
+            raise ConnectionResetError("printer closed the connection")
+        return data
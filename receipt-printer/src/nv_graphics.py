@@ -0,0 +1,114 @@
+# NV graphics memory support for Epson printers (GS ( L / GS 8 L)
+import os
+import json
+import hashlib
+from escpos.image import EscposImage
+
+GS = b'\x1D'
+GRAPHICS_COMMAND = GS + b'\x28\x4C'  # GS ( L, 2-byte length
+GRAPHICS_COMMAND_LONG = GS + b'\x38\x4C'  # GS 8 L, 4-byte length
+
+FN_GET_KEY_CODES = b'\x40'  # 64
+FN_DELETE = b'\x42'  # 66
+FN_DEFINE_RASTER = b'\x43'  # 67
+FN_PRINT = b'\x45'  # 69
+
+M = b'\x30'  # 48
+TONE_MONOCHROME = b'\x30'  # 48
+COLOR_1 = b'\x31'  # 49
+KEY_CODE_LIST_HEADER = b'\x37\x72'
+# Identification status after the header: 41h means another block follows once we ACK this one
+KEY_CODE_LIST_LAST_BLOCK = 0x40
+KEY_CODE_LIST_MORE_BLOCKS = 0x41
+ACK = b'\x06'
+
+NV_ASSET_STORE_PATH = os.environ.get('NV_ASSET_STORE_PATH', '/data/nv_assets.json')
+
+def asset_store_path(printer_id=None):
+    # NV memory is per printer, so each printer keeps its own hashes
+    if not printer_id:
+        return NV_ASSET_STORE_PATH
+    root, ext = os.path.splitext(NV_ASSET_STORE_PATH)
+    return f"{root}-{printer_id}{ext}"
+
+def graphics_command(payload):
+    return GRAPHICS_COMMAND + len(payload).to_bytes(2, 'little') + payload
+
+def define_nv_graphic_command(key, image_path):
+    image = EscposImage(image_path)
+    width = image.width_bytes * 8
+    height = image.height
+    payload = (M + FN_DEFINE_RASTER + TONE_MONOCHROME + key + b'\x01'
+               + width.to_bytes(2, 'little') + height.to_bytes(2, 'little')
+               + COLOR_1 + image.to_raster_format())
+    return GRAPHICS_COMMAND_LONG + len(payload).to_bytes(4, 'little') + payload
+
+def print_nv_graphic_command(key, scale_x=1, scale_y=1):
+    return graphics_command(M + FN_PRINT + key + bytes([scale_x, scale_y]))
+
+def delete_nv_graphic_command(key):
+    return graphics_command(M + FN_DELETE + key)
+
+def get_key_codes_command():
+    return graphics_command(M + FN_GET_KEY_CODES + b'KC')
+
+def parse_key_codes(response):
+    start = response.find(KEY_CODE_LIST_HEADER)
+    status_index = start + len(KEY_CODE_LIST_HEADER)
+    if start == -1 or len(response) <= status_index:
+        return None
+    status = response[status_index]
+    if status not in (KEY_CODE_LIST_LAST_BLOCK, KEY_CODE_LIST_MORE_BLOCKS):
+        return None
+    data = response[status_index + 1:]
+    end = data.find(b'\x00')
+    if end != -1:
+        data = data[:end]
+    keys = {bytes(data[i:i + 2]) for i in range(0, len(data) - 1, 2)}
+    return keys, status == KEY_CODE_LIST_MORE_BLOCKS
+
+def read_key_codes(printer, timeout_ms):
+    # Returns None if the printer didn't answer with a key code list
+    printer._raw(get_key_codes_command())
+    keys = set()
+    while True:
+        block = parse_key_codes(printer.read_available(timeout_ms))
+        if block is None:
+            return None
+        block_keys, more = block
+        keys |= block_keys
+        if not more:
+            return keys
+        printer._raw(ACK)
+
+def hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class NVAssetStore:
+    def __init__(self, path=NV_ASSET_STORE_PATH):
+        self.path = path
+        self.hashes = {}
+        try:
+            with open(self.path, 'r') as f:
+                self.hashes = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Failed to load NV asset store: {e}")
+
+    def get_hash(self, key):
+        return self.hashes.get(key.decode())
+
+    def set_hash(self, key, file_hash):
+        self.hashes[key.decode()] = file_hash
+        try:
+            store_dir = os.path.dirname(self.path)
+            if store_dir:
+                os.makedirs(store_dir, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.hashes, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to save NV asset store: {e}")
@@ -0,0 +1,18 @@
+# Processing-completion responses (GS ( H fn 48) for Epson printers
+GS = b'\x1D'
+RESPONSE_COMMAND = GS + b'\x28\x48'  # GS ( H
+FN_PROCESS_ID = b'\x30'  # 48
+M = b'\x30'  # 48
+PROCESS_RESPONSE_HEADER = b'\x37\x22'
+PROCESS_ID_MAX = 10000
+
+def process_id_for(counter):
+    # 4 ASCII digits, each in the 0x30-0x39 range the printer accepts
+    return f"{counter % PROCESS_ID_MAX:04d}".encode()
+
+def process_id_command(process_id):
+    payload = FN_PROCESS_ID + M + process_id
+    return RESPONSE_COMMAND + len(payload).to_bytes(2, 'little') + payload
+
+def process_response(process_id):
+    return PROCESS_RESPONSE_HEADER + process_id + b'\x00'
@@ -1,18 +1,20 @@
 import time
-from escpos.printer import Usb
+from escpos.printer import Dummy
 from escpos.exceptions import DeviceNotFoundError
 import threading
 import json
 import os
 from utils import format_string
+from usb_transport import PersistentUsb, find_serial_numbers
+from network_transport import PersistentNetwork
+from asb import enable_asb_command, find_asb_packets, decode_asb, status_from_asb
+from print_completion import process_id_for, process_id_command, process_response
+from user_settings import settings_store_path, UserSettingsStore, apply_settings
+from nv_graphics import asset_store_path, NVAssetStore, define_nv_graphic_command, print_nv_graphic_command, read_key_codes, hash_file
 
 # ~270x50 PNG, black on transparent
 LOGO_PATH = "receipt-logo.png"
 
-LOGO_FRAGMENT_HEIGHT = 100
-LOGO_SLEEP_BETWEEN_FRAGMENTS_MS = 0
-SLEEP_BETWEEN_SEGMENTS_MS = 50
-
 # EU-m30 (Kiosk)Settings
 MODEL_KIOSK = 0x0e2e
 
@@ -22,14 +24,52 @@ MODEL_TRADITIONAL = 0x0202
 # Shared settings
 MAKE = 0x04b8 # Epson
 PROFILE = "TM-T88IV"
-LOGO_FRAGMENT_HEIGHT = 2
-LOGO_SLEEP_BETWEEN_FRAGMENTS_MS = 50
-SLEEP_BETWEEN_SEGMENTS_MS = 50
+LOGO_FRAGMENT_HEIGHT = 100
+WRITE_CHUNK_SIZE = 4096
+COMPLETION_TIMEOUT_S = 30
+COMPLETION_READ_TIMEOUT_MS = 100
+LOGO_IMAGE_SETTINGS = {
+    "high_density_vertical": True,
+    "high_density_horizontal": True,
+    "impl": "bitImageRaster",
+    "fragment_height": LOGO_FRAGMENT_HEIGHT,
+    "center": False
+}
+WRITE_TIMEOUT_MS = 10000
 PRINT_COOLDOWN = 4
 POLL_COOLDOWN = 1
 TIMEOUT = 30
-TRANSMIT_READ_DELAY_MS = 300
 CONFIGURATION_SLEEP_TIME = 10
+CONFIGURATION_POLL_INTERVAL_S = 0.5
+# Comma-separated USB serial numbers; empty binds to any single printer
+RECEIPT_PRINTER_SERIALS = os.environ.get("RECEIPT_PRINTER_SERIALS", "")
+# Comma-separated host[:port] addresses of printers on the network (raw TCP, port 9100 by default)
+RECEIPT_PRINTER_HOSTS = os.environ.get("RECEIPT_PRINTER_HOSTS", "")
+DEFAULT_PRINTER_ID = "default"
+
+# GS ( E customized settings
+PRINT_DENSITY_SETTING = 5
+NORMAL_PRINT_DENSITY = 0  # 100%
+HIGH_PRINT_DENSITY = 6  # 130%
+PRINT_SPEED_SETTING = 6
+NORMAL_PRINT_SPEED = 8  # 1-13 for level 1 to level 13
+FAST_PRINT_SPEED = 12
+STATUS_MONITOR_INTERVAL_S = 10
+
+# Automatic Status Back settings
+ASB_MODE = os.environ.get("RECEIPT_PRINTER_ASB", "true").lower() == "true"
+ASB_READ_INTERVAL_S = 1
+ASB_READ_TIMEOUT_MS = 50
+ASB_FIRST_PACKET_TIMEOUT_MS = 1000
+ASB_RETRY_INTERVAL_S = 60
+
+# NV graphics settings
+NV_GRAPHICS_MODE = os.environ.get("RECEIPT_PRINTER_NV_GRAPHICS", "true").lower() == "true"
+NV_LOGO_KEY = b'RL'
+NV_ASSETS = {NV_LOGO_KEY: LOGO_PATH}
+NV_DEFINE_TIMEOUT_MS = 30000
+NV_KEY_CODES_TIMEOUT_MS = 500
+NV_SYNC_RETRY_INTERVAL_S = 300
 
 # EU-m30 printer status constants
 TRANSMIT_STATUS = b'\x10\x04'
@@ -65,92 +105,112 @@ VALID_PAPER_STATUSES = [0b00010010, 0b01110010, 0b00011110, 0b01111110]
 PAPER_OUT_MASK = 0b01110010
 PAPER_LOW_MASK = 0b00011110
 
+def get_model():
+    kiosk = os.environ.get("RECEIPT_PRINTER_KIOSK", "true").lower() == "true"
+    if kiosk:
+        return MODEL_KIOSK
+    return MODEL_TRADITIONAL
+
+def create_receipt_printer_managers():
+    addresses = [address.strip() for address in RECEIPT_PRINTER_HOSTS.split(",") if address.strip()]
+    managers = {address: ReceiptPrinterManager(address=address) for address in addresses}
+    serials = [serial.strip() for serial in RECEIPT_PRINTER_SERIALS.split(",") if serial.strip()]
+    if not serials:
+        found = find_serial_numbers(MAKE, get_model())
+        serials = found if len(found) > 1 else []
+        # A lone USB printer isn't bound to its serial, so swapping it needs no configuration
+        if not serials and (found or not managers):
+            managers[DEFAULT_PRINTER_ID] = ReceiptPrinterManager()
+    managers.update({serial: ReceiptPrinterManager(serial) for serial in serials})
+    print(f"Managing receipt printers: {list(managers)}")
+    return managers
+
 class ReceiptPrinterManager:
-    def __init__(self):
-        kiosk = os.environ.get("RECEIPT_PRINTER_KIOSK", "true").lower() == "true"
-        if kiosk:
-            model = MODEL_KIOSK
+    def __init__(self, serial=None, address=None):
+        self.printer_id = address or serial or DEFAULT_PRINTER_ID
+        if address:
+            self.printer = PersistentNetwork(address, profile=PROFILE)
         else:
-            model = MODEL_TRADITIONAL
-        self.printer = Usb(idVendor=MAKE, idProduct=model, usb_args={}, timeout=TIMEOUT, profile=PROFILE)
+            usb_args = {"serial_number": serial} if serial else {}
+            self.printer = PersistentUsb(idVendor=MAKE, idProduct=get_model(), usb_args=usb_args, timeout=TIMEOUT, profile=PROFILE)
         self.cooldown = PRINT_COOLDOWN
         self.last_request_time = 0
         self.lock = threading.Lock()
+        self.process_counter = 0
         self.last_status = None
-        self.get_status()
+        self.status_snapshot = None
+        self.status_refresh_requested = threading.Event()
+        self.asb_enabled = False
+        self.asb_session_id = None
+        self.last_asb_attempt = 0
+        self.user_settings = UserSettingsStore(settings_store_path(address or serial))
+        self.logo_raster = None
+        self.logo_raster_key = None
+        self.get_logo_raster()
+        self.nv_asset_store = NVAssetStore(asset_store_path(address or serial))
+        self.nv_keys = set()
+        self.last_nv_sync_attempt = 0
+        if NV_GRAPHICS_MODE:
+            self.sync_nv_assets()
+        self.refresh_status()
+        threading.Thread(target=self.monitor_status, daemon=True).start()
+        self.printer.watch_hotplug(self.printer_changed)
+
+    def printer_changed(self, attached):
+        # Verified settings are kept: they live in the printer's NVRAM and are stored with the unit's identity,
+        # so a different unit on the same port gets configured
+        # The attached unit may not hold our NV graphics, so the next sync re-reads its key list
+        self.nv_keys = set()
+        self.last_nv_sync_attempt = 0
+        # A replugged printer comes back with ASB off, so go back to polling until it is re-enabled
+        self.asb_enabled = False
+        self.last_asb_attempt = 0
+        self.request_status_refresh()
 
     def configure_printer(self, fast=False, high_density=True):
         print("Configuring printer")
-        try:
-
-            gs = b'\x1D' # prefix for GS commands
-            e_command = b'\x28\x45'  # prefix for GS ( E commands
-
-            # Function 1 - Open User Setting Mode 
-            pL = b'\x03' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x01' # function code 1
-            d1 = b'\x49' # data 1: character "I"
-            d2 = b'\x4E' # data 2: character "N"
-            print(f"Sending 'Open User Setting' command: {gs + e_command + pL + pH + fn + d1 + d2}")
-            self.printer._raw(gs + e_command + pL + pH + fn + d1 + d2)
-            self.clear_receipt_data_buffer()
-
-            # Function 5 - 5: Set Print Density
-            pL = b'\x04' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x05' # function code 5
-            a = b'\x05' # print density setting (5)
-            nL = b'\x00' # 0 for normal (100%), 6 for high density (130%)
-            if high_density:
-                nL = b'\x06'
-            nH = b'\x00' # high bit (unused)
-            print(f"Sending 'Set Print Density' command: {gs + e_command + pL + pH + fn + a + nL + nH}")
-            self.printer._raw(gs + e_command + pL + pH + fn + a + nL + nH)
-            self.clear_receipt_data_buffer()
-
-            # Function 5 - 6: Set Print Speed
-            pL = b'\x04' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x05' # function code 5
-            a = b'\x06' # print speed setting (6)
-            nL = b'\x08' # 1-13 for level 1 to level 13
-            if fast:
-                nL = b'\x0C'
-            nH = b'\x00' # high bit (unused)
-            print(f"Sending 'Set Print Speed' command: {gs + e_command + pL + pH + fn + a + nL + nH}")
-            self.printer._raw(gs + e_command + pL + pH + fn + a + nL + nH)
-            self.clear_receipt_data_buffer()
-
-            # Function 2 - Close User Setting Mode 
-            pL = b'\x04' # data length low byte
-            pH = b'\x00' # data length high byte
-            fn = b'\x02' # function code 2
-            d1 = b'\x4F' # data 1: character "O"
-            d2 = b'\x55' # data 2: character "U"
-            d3 = b'\x54' # data 3: character "T"
-            print(f"Sending 'Close User Setting' command: {gs + e_command + pL + pH + fn + d1 + d2 + d3}")
-            self.printer._raw(gs + e_command + pL + pH + fn + d1 + d2 + d3)
-            self.clear_receipt_data_buffer()
-
-            self.printer.close()
-
-            for i in range(CONFIGURATION_SLEEP_TIME):
-                print(f"Waiting... {i+1}/{CONFIGURATION_SLEEP_TIME} seconds")
-                time.sleep(1)
-            
-            return True
-        except Exception as e:
-            print(f"Configuration error: {str(e)}")
-            return False   
+        settings = {
+            PRINT_DENSITY_SETTING: HIGH_PRINT_DENSITY if high_density else NORMAL_PRINT_DENSITY,
+            PRINT_SPEED_SETTING: FAST_PRINT_SPEED if fast else NORMAL_PRINT_SPEED
+        }
+        with self.lock:
+            try:
+                self.printer.open()
+                printer = self.printer.identity()
+                if settings == self.user_settings.get(printer):
+                    print("Printer settings unchanged, skipping configuration")
+                    return True
+                changed, verified = apply_settings(self.printer, settings)
+                # Leaving user setting mode resets the printer, so start a fresh session
+                self.printer.disconnect()
+                ready = self.wait_for_printer()
+                self.asb_enabled = False
+                self.last_asb_attempt = 0
+                print(f"Configuration {'verified' if verified else 'not verified'}, changed: {changed}, ready: {ready}")
+                if verified and printer:
+                    self.user_settings.set(printer, settings)
+                return verified and ready
+            except Exception as e:
+                print(f"Configuration error: {str(e)}")
+                return False
+            finally:
+                self.request_status_refresh()
+
+    def wait_for_printer(self):
+        deadline = time.time() + CONFIGURATION_SLEEP_TIME
+        while time.time() < deadline:
+            try:
+                if int.from_bytes(self.printer.query(TRANSMIT_PRINTER_STATUS), byteorder='big') in VALID_PRINTER_STATUSES:
+                    return True
+            except (DeviceNotFoundError, OSError):
+                pass
+            time.sleep(CONFIGURATION_POLL_INTERVAL_S)
+        print(f"Printer not ready {CONFIGURATION_SLEEP_TIME} seconds after configuration")
+        return False
 
     def get_printer_status(self):
         print(f"Getting printer status")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_PRINTER_STATUS)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        printer_status_raw = self.printer._read()
-        self.printer.close()
+        printer_status_raw = self.printer.query(TRANSMIT_PRINTER_STATUS)
 
         #print(f"Printer status raw: {printer_status_raw}")
         printer_status_int = int.from_bytes(printer_status_raw, byteorder='big')
@@ -176,11 +236,7 @@ class ReceiptPrinterManager:
     
     def get_offline_cause(self):
         print(f"Getting offline cause")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_OFFLINE_CAUSE)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        offline_cause_raw = self.printer._read()
-        self.printer.close()
+        offline_cause_raw = self.printer.query(TRANSMIT_OFFLINE_CAUSE)
 
         print(f"Offline cause raw: {offline_cause_raw}")
         offline_cause_int = int.from_bytes(offline_cause_raw, byteorder='big')
@@ -210,11 +266,7 @@ class ReceiptPrinterManager:
     
     def get_error_cause(self):
         print(f"Getting error cause")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_ERROR_CAUSE)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        error_cause_raw = self.printer._read()
-        self.printer.close()
+        error_cause_raw = self.printer.query(TRANSMIT_ERROR_CAUSE)
 
         print(f"Error cause raw: {error_cause_raw}")
         error_cause_int = int.from_bytes(error_cause_raw, byteorder='big')
@@ -244,11 +296,7 @@ class ReceiptPrinterManager:
 
     def get_paper_status(self):
         print(f"Getting paper status")
-        self.printer.open()
-        self.printer._raw(TRANSMIT_PAPER_STATUS)
-        time.sleep(TRANSMIT_READ_DELAY_MS/1000)
-        paper_status_raw = self.printer._read()
-        self.printer.close()
+        paper_status_raw = self.printer.query(TRANSMIT_PAPER_STATUS)
 
         #print(f"Paper status raw: {paper_status_raw}")
         paper_status_int = int.from_bytes(paper_status_raw, byteorder='big')
@@ -269,7 +317,104 @@ class ReceiptPrinterManager:
             'paper_low': paper_low
         }
 
-    def get_status(self):
+    def get_status(self, max_age=None):
+        snapshot = self.status_snapshot
+        if snapshot is None or (max_age is not None and time.time() - snapshot["updated_at"] > max_age):
+            return self.refresh_status()
+        return snapshot
+
+    def request_status_refresh(self):
+        self.status_refresh_requested.set()
+
+    def monitor_status(self):
+        while True:
+            self.status_refresh_requested.wait(ASB_READ_INTERVAL_S if self.asb_enabled else STATUS_MONITOR_INTERVAL_S)
+            self.status_refresh_requested.clear()
+            # Don't queue up behind a print job; it requests a refresh when it finishes
+            if self.lock.locked():
+                continue
+            try:
+                self.refresh_status()
+                if self.nv_sync_due():
+                    self.sync_nv_assets()
+            except Exception as e:
+                print(f"Status monitor error: {str(e)}")
+
+    def refresh_status(self):
+        if self.asb_enabled:
+            return self.read_asb_status()
+        snapshot = self.poll_status()
+        if ASB_MODE and snapshot["status"] != "not_found" and time.time() - self.last_asb_attempt > ASB_RETRY_INTERVAL_S:
+            self.enable_asb()
+        return self.status_snapshot
+
+    def set_status(self, status, reason):
+        self.last_status = status
+        self.status_snapshot = {
+            "status": status,
+            "reason": reason,
+            "updated_at": time.time()
+        }
+        return self.status_snapshot
+
+    def apply_asb_packets(self, data):
+        packets = find_asb_packets(data)
+        if not packets:
+            return False
+        asb = decode_asb(packets[-1])
+        status, reason = status_from_asb(asb)
+        if status != self.last_status:
+            print(f"ASB status changed: {status} ({reason}), {asb}")
+        self.set_status(status, reason)
+        return True
+
+    def enable_asb(self):
+        print("Enabling Automatic Status Back")
+        self.last_asb_attempt = time.time()
+        with self.lock:
+            try:
+                self.printer.open()
+                self.printer._raw(enable_asb_command())
+                # The printer answers GS a with the current status
+                if self.apply_asb_packets(self.printer.read_available(ASB_FIRST_PACKET_TIMEOUT_MS)):
+                    self.asb_enabled = True
+                    self.asb_session_id = self.printer.session_id
+                else:
+                    print("No ASB packet received, continuing with status polling")
+            except Exception as e:
+                print(f"Enable ASB error: {str(e)}")
+            finally:
+                self.printer.close()
+        return self.asb_enabled
+
+    def read_asb_status(self):
+        with self.lock:
+            try:
+                self.printer.open()
+                if self.printer.session_id != self.asb_session_id:
+                    # New USB handle since ASB was enabled; fall back to polling until it is re-enabled
+                    print("Printer reconnected, re-enabling ASB")
+                    self.asb_enabled = False
+                    self.last_asb_attempt = 0
+                    return self.status_snapshot
+                if not self.apply_asb_packets(self.printer.read_available(ASB_READ_TIMEOUT_MS)):
+                    # No change since the last packet
+                    self.set_status(self.status_snapshot["status"], self.status_snapshot["reason"])
+            except DeviceNotFoundError as e:
+                print(f"Printer not found: {str(e)}")
+                self.asb_enabled = False
+                self.set_status("not_found", str(e))
+            except Exception as e:
+                print(f"ASB read error: {str(e)}")
+                # Re-enable on the next refresh to get a fresh status packet
+                self.asb_enabled = False
+                self.last_asb_attempt = 0
+                self.set_status("unknown", f"exception: {str(e)}")
+            finally:
+                self.printer.close()
+            return self.status_snapshot
+
+    def poll_status(self):
         with self.lock:
             self.throttle(printing=False)
             status = "unknown"
@@ -329,12 +474,8 @@ class ReceiptPrinterManager:
                 status = "unknown"
                 reason = f"exception: {str(e)}"
             finally:
-                self.last_status = status
                 self.printer.close()
-            return {
-                "status": status,
-                "reason": reason
-            }
+            return self.set_status(status, reason)
 
     def throttle(self, printing=True):
         current_time = time.time()
@@ -358,105 +499,172 @@ class ReceiptPrinterManager:
                 self.printer.close()
                 return False
             try:
-                self.start_print_job()
-                instructions = "PAY AT REGISTER"
-
-                self.print_logo()
-                self.print_heading(order)
-                self.print_message(instructions, bold=True)
-                self.print_details(details)
-                
-                if(upcs):
-                    try:
-                        upcs = json.loads(upcs)
-                    except json.JSONDecodeError:
-                        print(f"Error: Invalid UPC format. Received: {upcs}")
-                        upcs = []
-                    for upc in upcs:
-                        self.print_barcode(upc)
-                
-                self.print_message(message)
-                
-                self.end_print_job()
-                
+                receipt = self.render_receipt(order, upcs, details, message)
+            except Exception as e:
+                print(f"Render error: {str(e)}")
+                return False
+            try:
+                print(f"Printing")
+                self.printer.open()
+                self.write_buffer(receipt)
+                self.wait_for_completion()
                 return True
-            
             except Exception as e:
                 print(f"Print error: {str(e)}")
-                self.end_print_job()
                 return False
-            
-    def start_print_job(self):
-        self.printer.open()
-        self.printer.set_sleep_in_fragment(LOGO_SLEEP_BETWEEN_FRAGMENTS_MS)
-        self.printer.set(align='center', normal_textsize=True, flip=False)
-        print(f"Printing")
-
-    def end_print_job(self):
-        self.printer.cut()
-        self.printer.close()
-
-    def print_logo(self):
-        self.printer.image(LOGO_PATH,
-                           high_density_vertical=True, 
-                           high_density_horizontal=True, 
-                           impl='bitImageRaster', 
-                           fragment_height=LOGO_FRAGMENT_HEIGHT, 
-                           center=False)
-        self.clear_receipt_data_buffer()
-
-    def print_heading(self, order):
+            finally:
+                self.printer.close()
+                self.request_status_refresh()
+
+    def wait_for_completion(self):
+        # GS ( H is answered only once all preceding data has been printed, so the next
+        # job can start as soon as the mechanism is free instead of after PRINT_COOLDOWN
+        self.process_counter += 1
+        process_id = process_id_for(self.process_counter)
+        response = process_response(process_id)
+        self.printer._raw(process_id_command(process_id))
+        start_time = time.time()
+        data = b''
+        while time.time() - start_time < COMPLETION_TIMEOUT_S:
+            try:
+                data += self.printer.read_bytes(COMPLETION_READ_TIMEOUT_MS)
+            except OSError as e:
+                print(f"Completion read error: {str(e)}")
+                return False
+            if response in data:
+                # Status changes during the job arrive as ASB packets on the same endpoint
+                self.apply_asb_packets(data.replace(response, b''))
+                self.cooldown = 0
+                print(f"Print completed in {time.time() - start_time:.2f} seconds")
+                return True
+        print(f"No completion response after {COMPLETION_TIMEOUT_S} seconds, falling back to print cooldown")
+        return False
+
+    def render_receipt(self, order, upcs, details, message):
+        renderer = Dummy(profile=PROFILE)
+        renderer.set(align='center', normal_textsize=True, flip=False)
+        instructions = "PAY AT REGISTER"
+
+        self.print_logo(renderer)
+        self.print_heading(renderer, order)
+        self.print_message(renderer, instructions, bold=True)
+        self.print_details(renderer, details)
+
+        if(upcs):
+            try:
+                upcs = json.loads(upcs)
+            except json.JSONDecodeError:
+                print(f"Error: Invalid UPC format. Received: {upcs}")
+                upcs = []
+            for upc in upcs:
+                self.print_barcode(renderer, upc)
+
+        self.print_message(renderer, message)
+        renderer.cut()
+        return renderer.output
+
+    def write_buffer(self, data, timeout_ms=WRITE_TIMEOUT_MS):
+        # Large bulk writes with a long timeout: the printer NAKs while its receive
+        # buffer is full, so the USB transfer itself paces the data
+        start_time = time.time()
+        for i in range(0, len(data), WRITE_CHUNK_SIZE):
+            self.printer.write_bytes(data[i:i + WRITE_CHUNK_SIZE], timeout_ms)
+        print(f"Sent {len(data)} bytes in {time.time() - start_time:.2f} seconds")
+
+    def get_logo_raster(self):
+        # Decoding and rasterizing the PNG is slow on the Pi, so keep the ESC/POS bytes
+        # until the file or the image settings change
+        cache_key = (os.path.getmtime(LOGO_PATH), PROFILE, tuple(sorted(LOGO_IMAGE_SETTINGS.items())))
+        if self.logo_raster is None or self.logo_raster_key != cache_key:
+            print(f"Rasterizing logo")
+            renderer = Dummy(profile=PROFILE)
+            renderer.image(LOGO_PATH, **LOGO_IMAGE_SETTINGS)
+            self.logo_raster = renderer.output
+            self.logo_raster_key = cache_key
+        return self.logo_raster
+
+    def print_logo(self, printer):
+        if NV_LOGO_KEY in self.nv_keys:
+            printer._raw(print_nv_graphic_command(NV_LOGO_KEY))
+        else:
+            printer._raw(self.get_logo_raster())
+
+    def nv_sync_due(self):
+        return (NV_GRAPHICS_MODE
+                and self.nv_keys != set(NV_ASSETS)
+                and self.last_status in ("ready", "low_paper")
+                and time.time() - self.last_nv_sync_attempt > NV_SYNC_RETRY_INTERVAL_S)
+
+    def sync_nv_assets(self):
+        # NV memory has limited write endurance, so only upload images whose hash
+        # changed or that are missing from the printer
+        self.last_nv_sync_attempt = time.time()
+        synced = set()
+        with self.lock:
+            try:
+                self.printer.open()
+                printer_keys = read_key_codes(self.printer, NV_KEY_CODES_TIMEOUT_MS)
+                for key, path in NV_ASSETS.items():
+                    file_hash = hash_file(path)
+                    on_printer = printer_keys is None or key in printer_keys
+                    if not on_printer or self.nv_asset_store.get_hash(key) != file_hash:
+                        print(f"Uploading {path} to NV graphics memory as {key.decode()}")
+                        self.write_buffer(define_nv_graphic_command(key, path), NV_DEFINE_TIMEOUT_MS)
+                        self.nv_asset_store.set_hash(key, file_hash)
+                    synced.add(key)
+            except Exception as e:
+                print(f"NV asset sync error: {str(e)}")
+            finally:
+                self.printer.close()
+        self.nv_keys = synced
+        print(f"NV graphics synced: {sorted(key.decode() for key in synced)}")
+        return synced == set(NV_ASSETS)
+
+    def print_heading(self, printer, order):
         if order:
             print(f"Printing heading")
-            self.printer.ln(1)
-            self.printer.set(align='center', double_height=True, double_width=True, bold=True, density=3)
-            self.printer.text(format_string(f"{str(order).title()}", double_size=True, flip=False))
-            self.printer.set(align='center', normal_textsize=True, flip=False)
-            self.clear_receipt_data_buffer()
+            printer.ln(1)
+            printer.set(align='center', double_height=True, double_width=True, bold=True, density=3)
+            printer.text(format_string(f"{str(order).title()}", double_size=True, flip=False))
+            printer.set(align='center', normal_textsize=True, flip=False)
         else:  
             print(f"No order provided, skipping heading")
 
-    def print_details(self, details):
+    def print_details(self, printer, details):
         if details:
             print(f"Printing details")
-            self.printer.ln(2)
-            self.printer.set(align='center', normal_textsize=True)
-            self.printer.text(format_string(details, double_size=False, flip=False))
-            self.clear_receipt_data_buffer()
+            printer.ln(2)
+            printer.set(align='center', normal_textsize=True)
+            printer.text(format_string(details, double_size=False, flip=False))
         else:
             print(f"No details provided, skipping details")
 
-    def print_barcode(self, upc):
+    def print_barcode(self, printer, upc):
         if upc:
             print(f"Printing barcode")
             upc_str = str(upc)
 
             if not upc_str.isdigit() or len(upc_str) != 12:
                 print(f"Error: Invalid UPC format. Received: {upc}")
-                self.print_message("Invalid UPC")
+                self.print_message(printer, "Invalid UPC")
                 return
         
-            self.printer.ln(2)
-            self.printer.barcode(upc_str, 'UPC-A', 64, 2, '', 'A', True, 'B')
-            self.clear_receipt_data_buffer()
+            printer.ln(2)
+            printer.barcode(upc_str, 'UPC-A', 64, 2, '', 'A', True, 'B')
         else:
             print(f"No UPC provided, skipping barcode")
 
-    def print_message(self, message, bold=False):
+    def print_message(self, printer, message, bold=False):
         if message:
             print(f"Printing message")
-            self.printer.ln(2)
-            self.printer.set(align='center', normal_textsize=True, bold=bold)
-            self.printer.text(format_string(message, double_size=False, flip=False))
+            printer.ln(2)
+            printer.set(align='center', normal_textsize=True, bold=bold)
+            printer.text(format_string(message, double_size=False, flip=False))
             if bold: 
-                self.printer.set(align='center', normal_textsize=True, bold=False)
-            self.clear_receipt_data_buffer()
+                printer.set(align='center', normal_textsize=True, bold=False)
         else:
             print(f"No message provided, skipping message")
     
-    def clear_receipt_data_buffer(self):
-        time.sleep(SLEEP_BETWEEN_SEGMENTS_MS/1000)
-
     def reload_paper(self):
         with self.lock:
             self.throttle()
@@ -466,8 +674,11 @@ class ReceiptPrinterManager:
                 self.printer.text("RELOADING PAPER")
                 self.printer.ln(12)
                 self.printer.cut()
+                self.wait_for_completion()
                 self.printer.close()
             except Exception as e:
                 print(f"Reload paper error: {str(e)}")
                 return False
+            finally:
+                self.request_status_refresh()
             return True
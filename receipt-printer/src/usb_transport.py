@@ -0,0 +1,98 @@
+# Persistent USB connection to Epson printers
+import threading
+import time
+import usb.core
+import usb.util
+from escpos.printer import Usb
+from escpos.exceptions import DeviceNotFoundError
+from transport import PersistentTransport
+
+HOTPLUG_POLL_INTERVAL_S = 0.5
+
+def find_serial_numbers(id_vendor, id_product):
+    serials = []
+    for device in usb.core.find(find_all=True, idVendor=id_vendor, idProduct=id_product):
+        try:
+            serial = usb.util.get_string(device, device.iSerialNumber)
+        except (usb.core.USBError, ValueError) as e:
+            print(f"Could not read printer serial number: {str(e)}")
+            continue
+        if serial:
+            serials.append(serial)
+    return serials
+
+class PersistentUsb(PersistentTransport, Usb):
+    timeout_errors = (usb.core.USBTimeoutError,)
+
+    def __init__(self, *args, **kwargs):
+        # Vendor and product first so find() only reads serial numbers of matching devices
+        self.match_args = dict({"idVendor": kwargs.get("idVendor"), "idProduct": kwargs.get("idProduct")},
+                               **(kwargs.get("usb_args") or {}))
+        self.init_session()
+        super().__init__(*args, **kwargs)
+
+    def connect(self):
+        Usb.open(self)
+
+    def release(self):
+        Usb.close(self)
+
+    def send(self, data, timeout_ms=None):
+        if timeout_ms is None:
+            Usb._raw(self, data)
+        else:
+            self.device.write(self.out_ep, data, timeout_ms)
+
+    def receive(self, size, timeout_ms):
+        try:
+            return bytes(self.device.read(self.in_ep, size, timeout_ms))
+        except usb.core.USBTimeoutError:
+            return b''
+
+    def identity(self):
+        # Read from the open device, so an unbound printer swapped for another unit is told apart
+        try:
+            return usb.util.get_string(self.device, self.device.iSerialNumber) or None
+        except (usb.core.USBError, ValueError, AttributeError):
+            return None
+
+    def is_attached(self):
+        return usb.core.find(**self.match_args) is not None
+
+    def watch_hotplug(self, on_change=None):
+        threading.Thread(target=self.hotplug_loop, args=(on_change,), daemon=True).start()
+
+    def hotplug_loop(self, on_change):
+        # pyusb has no hotplug callbacks, so poll the bus; enumeration doesn't touch the open handle
+        try:
+            attached = self.is_attached()
+        except usb.core.USBError as e:
+            # Don't let a startup error end the watcher; take the baseline from the first good poll
+            print(f"USB enumeration error: {str(e)}")
+            attached = None
+        while True:
+            time.sleep(HOTPLUG_POLL_INTERVAL_S)
+            try:
+                now_attached = self.is_attached()
+            except usb.core.USBError as e:
+                print(f"USB enumeration error: {str(e)}")
+                continue
+            if attached is None:
+                attached = now_attached
+                continue
+            if now_attached == attached:
+                continue
+            if now_attached:
+                print("Printer attached, rebinding")
+                try:
+                    self.reconnect()
+                except (DeviceNotFoundError, usb.core.USBError) as e:
+                    # Enumerated before it was ready; try again on the next poll
+                    print(f"Rebind failed: {str(e)}")
+                    continue
+            else:
+                print("Printer detached")
+                self.disconnect()
+            attached = now_attached
+            if on_change:
+                on_change(attached)